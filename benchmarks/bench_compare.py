@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Comparing saves with their parent, as the diff viewer does, once the
+store lock has been taken and released between comparisons.
+
+    bench_compare.py [SAVES] [FILES]
+
+Writes SAVES saves (default 60) of a tree of FILES files (default 2000),
+each changing a few of them."""
+import os
+import sys
+import time
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modules'))
+from helpers.tracker_engine import TrackerEngine
+
+def main():
+    saves = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    with tempfile.TemporaryDirectory() as root:
+        for n in range(count):
+            directory = os.path.join(root, f"dir{n // 100}")
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f"file{n}.txt"), 'w') as f:
+                f.write(f"file {n}\n")
+        engine = TrackerEngine(root)
+        engine.use_inotify = False
+        try:
+            engine.open(watch=False)
+            for n in range(saves):
+                with open(os.path.join(root, f"dir{n % 20}", f"file{n * 100 % count}.txt"), 'a') as f:
+                    f.write(f"edit {n}\n")
+                engine.save_state(f"Save {n}")
+            ids = engine.store.list_saves()
+            times = []
+            # Each compare takes the lock, so the store reloads every time
+            for save_id in ids[1:]:
+                start = time.perf_counter()
+                engine.compare(engine.previous_save(save_id), save_id)
+                times.append((time.perf_counter() - start) * 1000)
+        finally:
+            engine.close()
+    print(f"{len(times)} compares of {count} files: median {statistics.median(times):.2f} ms, "
+          f"max {max(times):.2f} ms")
+
+if __name__ == "__main__":
+    main()
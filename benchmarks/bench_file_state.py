@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Memory and diff time of FileState against a plain dict of path -> digest.
+
+    bench_file_state.py [PATHS] [CHANGES]
+
+PATHS paths in a monorepo-like layout (default 500000) with blake2b
+digests, CHANGES of them modified (default 120)."""
+import os
+import sys
+import time
+import hashlib
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modules'))
+from helpers.file_state import FileState
+
+def make_files(count):
+    files = {}
+    for n in range(count):
+        path = f"services/svc{n // 5000}/src/pkg{n // 100 % 50}/module_{n}.py"
+        files[path] = hashlib.blake2b(str(n).encode()).hexdigest()
+    return files
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, elapsed
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - start) * 1000
+
+def dict_diff(old, new):
+    changed = {p: d for p, d in new.items() if old.get(p) != d}
+    return changed, [p for p in old if p not in new]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    changes = int(sys.argv[2]) if len(sys.argv) > 2 else 120
+    files = make_files(count)
+    step = max(1, count // changes)
+    changed = {path: hashlib.blake2b(path.encode()).hexdigest()
+               for path in list(files)[::step][:changes]}
+    edited = dict(files, **changed)
+
+    # Both built from fresh strings, so neither shares them with files
+    plain, plain_size, _ = measure(lambda: make_files(count))
+    state, state_size, _ = measure(lambda: FileState(make_files(count)))
+    _, build = timed(lambda: FileState(files))
+    print(f"{count} paths: dict {plain_size / 2**20:.0f} MiB, "
+          f"FileState {state_size / 2**20:.0f} MiB ({plain_size / state_size:.1f}x), "
+          f"built in {build / 1000:.2f} s")
+
+    result, ms = timed(lambda: dict_diff(plain, edited))
+    assert len(result[0]) == len(changed)
+    print(f"diff, {len(changed)} changes:  dict {ms:.1f} ms")
+    updated = state.updated(changed, [])
+    result, ms = timed(lambda: state.diff(updated))
+    assert len(result[0]) == len(changed)
+    print(f"  FileState sharing a base {ms:.1f} ms")
+    rescanned = FileState(edited)
+    result, ms = timed(lambda: state.diff(rescanned))
+    assert len(result[0]) == len(changed)
+    print(f"  FileState from separate scans {ms:.1f} ms")
+    unchanged = FileState(files)
+    result, ms = timed(lambda: state.diff(unchanged))
+    assert not result[0] and not result[1]
+    print(f"  unchanged rescan {ms:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Outline analysis of one large generated module, plus indexing its
+symbols for search.
+
+    bench_outline.py [CLASSES]
+
+CLASSES classes of 8 methods each (default 110, about 5000 lines)."""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modules'))
+from helpers.struc import FileAnalyzer, SymbolIndex
+
+RUNS = 5
+
+def make_module(classes):
+    lines = ["import os", "import sys", ""]
+    for n in range(classes):
+        lines += [f"class Class{n}:", f"    LIMIT = {n}", ""]
+        for m in range(8):
+            lines += [f"    def method_{m}(self, value, *args):",
+                      f"        if value > self.LIMIT:",
+                      f"            return value - {m}",
+                      f"        return value", ""]
+        lines += [f"async def fetch_{n}(url):", "    return url", ""]
+    return "\n".join(lines).encode()
+
+def count(symbols):
+    return sum(1 + count(symbol['children']) for symbol in symbols)
+
+def main():
+    classes = int(sys.argv[1]) if len(sys.argv) > 1 else 110
+    source = make_module(classes)
+    analyzer = FileAnalyzer()
+    analysis = index = float('inf')
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        symbols = analyzer.analyze_source(source)
+        analysis = min(analysis, time.perf_counter() - start)
+        start = time.perf_counter()
+        SymbolIndex().update_file('module.py', None, symbols)
+        index = min(index, time.perf_counter() - start)
+    lines = source.count(b'\n') + 1
+    print(f"{lines} lines, {count(symbols)} symbols")
+    print(f"analysis: {analysis * 1000:.1f} ms")
+    print(f"index:    {index * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
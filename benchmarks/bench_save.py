@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Save throughput: the single-pass save pipeline against hashing the tree
+and copying every file afterwards, as saves used to.
+
+    bench_save.py [FILES] [DIR]
+
+Writes FILES files of 1-16 KB (default 10000, about 85 MB) below DIR, a
+temporary directory by default. Put DIR on the filesystem to measure,
+tmpfs hides most of the I/O."""
+import os
+import sys
+import time
+import shutil
+import hashlib
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modules'))
+from helpers.tracker_engine import TrackerEngine
+
+RUNS = 3
+
+def make_tree(root, count):
+    rng = random.Random(0)
+    for n in range(count):
+        directory = os.path.join(root, f"dir{n // 100}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file{n}.dat"), 'wb') as f:
+            f.write(rng.randbytes(rng.randint(1024, 16 * 1024)))
+
+def naive_save(root, target):
+    """Hash every file, then copy each one into target"""
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, root)] = hashlib.blake2b(f.read()).hexdigest()
+    for rel_path, digest in files.items():
+        dst = os.path.join(target, digest[:2], digest[2:])
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copy2(os.path.join(root, rel_path), dst)
+
+def engine_save(root):
+    engine = TrackerEngine(root)
+    engine.use_inotify = False
+    try:
+        # open() writes the initial save into the empty store
+        start = time.perf_counter()
+        engine.open(watch=False)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        engine.save_state("Repeat")
+        repeat = time.perf_counter() - start
+    finally:
+        engine.close()
+    return cold, repeat
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    base = sys.argv[2] if len(sys.argv) > 2 else None
+    with tempfile.TemporaryDirectory(dir=base) as tmp:
+        root = os.path.join(tmp, 'tree')
+        make_tree(root, count)
+        size = sum(os.path.getsize(os.path.join(d, n)) for d, _, ns in os.walk(root) for n in ns)
+        print(f"{count} files, {size / 1024 / 1024:.1f} MB in {tmp}")
+
+        naive, cold, repeat = [], [], []
+        for _ in range(RUNS):
+            target = os.path.join(tmp, 'copies')
+            start = time.perf_counter()
+            naive_save(root, target)
+            naive.append(time.perf_counter() - start)
+            shutil.rmtree(target)
+
+            times = engine_save(root)
+            cold.append(times[0])
+            repeat.append(times[1])
+            shutil.rmtree(os.path.join(root, '.saves'))
+
+        print(f"hash then copy2:         {min(naive):.3f} s")
+        print(f"save pipeline, cold:     {min(cold):.3f} s ({min(naive) / min(cold):.2f}x)")
+        print(f"save of unchanged tree:  {min(repeat):.3f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Tree walk with a large ignored directory: os.walk filtering every path
+against the pruned scandir walk of stat_files.
+
+    bench_scan.py [PACKAGES] [PROJECT_FILES] [DIR]
+
+Builds node_modules with PACKAGES packages of 50 files each (default 2000,
+100k files) next to PROJECT_FILES tracked files (default 2000)."""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modules'))
+from helpers.tracker_engine import TrackerEngine
+
+RUNS = 5
+
+def make_tree(root, packages, project_files):
+    for n in range(packages):
+        directory = os.path.join(root, 'node_modules', f"pkg{n}", 'lib')
+        os.makedirs(directory)
+        for m in range(50):
+            with open(os.path.join(directory, f"m{m}.js"), 'w') as f:
+                f.write("module.exports = 1;\n")
+    for n in range(project_files):
+        directory = os.path.join(root, 'src', f"part{n // 50}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"mod{n}.py"), 'w') as f:
+            f.write(f"VALUE = {n}\n")
+
+def old_walk(engine):
+    """os.walk enters every directory, ignored paths are dropped afterwards"""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(engine.cwd):
+        rel_dir = os.path.relpath(dirpath, engine.cwd)
+        if any(part in engine.ignore_dirs for part in rel_dir.split(os.sep)):
+            continue
+        for name in filenames:
+            rel_path = os.path.normpath(os.path.join(rel_dir, name))
+            if not engine.should_ignore(rel_path):
+                files.append((rel_path, os.stat(os.path.join(dirpath, name))))
+    return files
+
+def best(function):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    packages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    project_files = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    base = sys.argv[3] if len(sys.argv) > 3 else None
+    with tempfile.TemporaryDirectory(dir=base) as root:
+        make_tree(root, packages, project_files)
+        engine = TrackerEngine(root)
+        engine.use_inotify = False
+        try:
+            old, old_files = best(lambda: old_walk(engine))
+            new, new_files = best(lambda: list(engine.stat_files(root)))
+            assert len(old_files) == len(new_files) == project_files
+            engine.get_files()
+            warm, _ = best(engine.get_files)
+        finally:
+            engine.close()
+        print(f"{packages * 50} ignored files, {project_files} tracked")
+        print(f"os.walk + should_ignore:  {old:.4f} s")
+        print(f"pruned scandir walk:      {new:.4f} s ({old / new:.1f}x)")
+        print(f"warm get_files:           {warm:.4f} s")
+
+if __name__ == "__main__":
+    main()
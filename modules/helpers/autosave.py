@@ -0,0 +1,36 @@
+import time
+
+class AutosavePolicy:
+    """When to autosave: once edits have been quiet for quiet seconds, or
+    max_delay seconds after the first unsaved edit when they never stop.
+
+    The tracker reports every check that finds new unsaved changes through
+    note_change() and calls reset() once they are saved or gone, so nothing
+    is ever due without an unsaved change."""
+
+    def __init__(self, enabled=False, quiet=30, max_delay=15 * 60):
+        self.enabled = enabled
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.first_change = None
+        self.last_change = None
+
+    @property
+    def pending(self):
+        return self.first_change is not None
+
+    def note_change(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.first_change is None:
+            self.first_change = now
+        self.last_change = now
+
+    def reset(self):
+        self.first_change = self.last_change = None
+
+    def due(self, now=None):
+        if not self.enabled or self.first_change is None:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - self.last_change >= self.quiet or \
+            now - self.first_change >= self.max_delay
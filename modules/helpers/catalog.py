@@ -0,0 +1,161 @@
+import os
+import json
+from helpers.store_lock import LogTail
+
+CATALOG_NAME = 'catalog.jsonl'
+
+def save_sort_key(save_id):
+    """Chronological order for ids like 20250120_143858 and 20250120_143858_12"""
+    parts = save_id.split('_')
+    suffix = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+    return ('_'.join(parts[:2]), suffix, save_id)
+
+class SaveCatalog:
+    """Append-only index of saves, so listing them never opens a manifest.
+
+    One JSON line per save with id, timestamp, comment, file count, bytes
+    added to the store, parent and chunk dedup totals. Removed saves get a tombstone line and
+    the file is compacted once tombstones outnumber live entries."""
+
+    def __init__(self, saves_dir):
+        self.saves_dir = saves_dir
+        self.path = os.path.join(saves_dir, CATALOG_NAME)
+        self.entries = {}
+        self.order = []
+        self.tombstones = 0
+        self.loaded = False
+        self.tail = LogTail(self.path)
+
+    def load(self):
+        self.entries.clear()
+        self.tombstones = 0
+        self.tail = LogTail(self.path)
+        _, entries = self.tail.read()
+        for entry in entries:
+            self.apply(entry)
+        self.order = sorted(self.entries, key=save_sort_key)
+        self.loaded = True
+
+    def apply(self, entry):
+        if entry.get('deleted'):
+            self.entries.pop(entry['id'], None)
+            self.tombstones += 1
+        else:
+            self.entries[entry['id']] = entry
+
+    def reload(self, store):
+        """Pick up saves other processes added or removed since the last
+        look, rereading everything if the file was compacted. Returns
+        whether anything changed, True when it cannot tell."""
+        if not self.loaded:
+            return True
+        reset, entries = self.tail.read()
+        if reset:
+            self.loaded = False
+            self.ensure_loaded(store)
+        elif entries:
+            for entry in entries:
+                self.apply(entry)
+            self.order = sorted(self.entries, key=save_sort_key)
+        return reset or bool(entries)
+
+    def ensure_loaded(self, store):
+        """Load the catalogue and reconcile it with the save directories"""
+        if self.loaded:
+            return
+        self.load()
+        if not os.path.isdir(self.saves_dir):
+            return
+        on_disk = {name for name in os.listdir(self.saves_dir)
+                   if os.path.isfile(os.path.join(self.saves_dir, name, 'meta.json'))}
+        missing = sorted(on_disk - set(self.entries), key=save_sort_key)
+        gone = set(self.entries) - on_disk
+        for save_id in gone:
+            self.remove(save_id)
+        for save_id in missing:
+            try:
+                self.add(self.entry_from_manifest(store, save_id))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skipping unreadable save {save_id}: {e}")
+
+    @staticmethod
+    def entry_from_manifest(store, save_id):
+        meta = store.read_manifest(save_id)
+        count = meta.get('file_count')
+        if count is None:
+            count = len(store.load_files(save_id))
+        size = meta.get('bytes')
+        if size is None:
+            # Old full-copy saves: everything in the directory is theirs
+            size = 0
+            for root, _, files in os.walk(os.path.join(store.saves_dir, save_id)):
+                for name in files:
+                    size += os.path.getsize(os.path.join(root, name))
+        return {
+            'id': save_id,
+            'timestamp': meta.get('timestamp', save_id),
+            'comment': meta.get('comment', ''),
+            'files': count,
+            'bytes': size,
+            'parent': meta.get('parent'),
+            'dedup': meta.get('dedup'),
+        }
+
+    def append(self, entry):
+        with open(self.path, 'ab') as f:
+            start = f.tell()
+            f.write(json.dumps(entry).encode() + b'\n')
+            # Not to be read back as another process's line
+            self.tail.appended(start, f.tell())
+
+    def add(self, entry):
+        self.append(entry)
+        if entry['id'] not in self.entries:
+            self.order.append(entry['id'])
+            if len(self.order) > 1 and \
+                    save_sort_key(self.order[-2]) > save_sort_key(entry['id']):
+                self.order.sort(key=save_sort_key)
+        self.entries[entry['id']] = entry
+
+    def remove(self, save_id):
+        if save_id not in self.entries:
+            return
+        self.append({'id': save_id, 'deleted': True})
+        del self.entries[save_id]
+        self.order.remove(save_id)
+        self.tombstones += 1
+        if self.tombstones > max(len(self.entries), 64):
+            self.compact()
+
+    def compact(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for save_id in self.order:
+                f.write(json.dumps(self.entries[save_id]) + '\n')
+        os.replace(tmp, self.path)
+        self.tail.rewritten()
+        self.tombstones = 0
+
+    def rebuild(self, store):
+        """Recreate the catalogue from the save directories"""
+        self.entries.clear()
+        self.order = []
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.loaded = False
+        self.ensure_loaded(store)
+        self.compact()
+
+    def __len__(self):
+        return len(self.order)
+
+    def ids(self):
+        return list(self.order)
+
+    def get(self, save_id):
+        return self.entries.get(save_id)
+
+    def page(self, offset=0, limit=100, newest_first=True):
+        """A slice of the history, newest first by default"""
+        ids = self.order[::-1] if newest_first else self.order
+        return [self.entries[save_id] for save_id in ids[offset:offset + limit]]
@@ -0,0 +1,159 @@
+import os
+import hashlib
+import json
+from helpers.store_lock import LogTail
+
+# Files at least this large are split into content-defined chunks when they
+# cannot be reflinked, so a partly changed file only stores its new chunks
+CHUNK_THRESHOLD = 8 * 1024 * 1024
+MIN_CHUNK = 128 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+
+def _symbol_table():
+    # Every symbol 0-15 gets 16 byte values, spread by a fixed hash so the
+    # mapping is the same on every machine and Python version
+    order = sorted(range(256), key=lambda v: hashlib.blake2b(bytes([v])).digest())
+    table = bytearray(256)
+    for i, v in enumerate(order):
+        table[v] = i % 16
+    return bytes(table)
+
+# Each byte is reduced to a 4-bit symbol and a cut follows every occurrence
+# of this 5-symbol pattern, about one position in 2**20, so chunks average
+# MIN_CHUNK + 1 MiB. Runs of a single byte value never match it.
+SYMBOL_TABLE = _symbol_table()
+ANCHOR = bytes([11, 2, 7, 13, 4])
+
+class Chunker:
+    """Splits a stream into content-defined chunks.
+
+    Boundaries depend only on the bytes around them, so an insertion early in
+    a file only changes the chunks next to it. The window test is a
+    bytes.translate and a substring search, both running in C, instead of a
+    per-byte Python loop."""
+
+    def __init__(self, min_size=MIN_CHUNK, max_size=MAX_CHUNK):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.buf = b''
+        self.symbols = b''
+        self.scanned = 0
+
+    def feed(self, data):
+        """Add data, returns the chunks it completed as memoryviews"""
+        buf = self.buf + data if self.buf else data
+        symbols = self.symbols + data.translate(SYMBOL_TABLE)
+        view = memoryview(buf)
+        chunks = []
+        pos = 0
+        scanned = self.scanned
+        while len(buf) - pos >= self.min_size:
+            start = max(pos + self.min_size - len(ANCHOR), scanned - len(ANCHOR) + 1)
+            end = min(len(buf), pos + self.max_size)
+            found = symbols.find(ANCHOR, start, end)
+            if found >= 0:
+                cut = found + len(ANCHOR)
+            elif end == pos + self.max_size:
+                cut = end
+            else:
+                scanned = end
+                break
+            chunks.append(view[pos:cut])
+            pos = scanned = cut
+        # Offsets stay relative to the unconsumed tail
+        self.buf = buf[pos:]
+        self.symbols = symbols[pos:]
+        self.scanned = max(scanned - pos, 0)
+        return chunks
+
+    def finish(self):
+        """The remaining tail, if any"""
+        chunks = [self.buf] if self.buf else []
+        self.buf = self.symbols = b''
+        self.scanned = 0
+        return chunks
+
+class ChunkIndex:
+    """Recipes of chunked objects.
+
+    recipes.jsonl maps a file digest to [size, mode, mtime_ns, chunks] with
+    chunks a list of [chunk digest, length]. Chunks are ordinary objects of
+    the snapshot store, shared by every file and save that contains them."""
+
+    def __init__(self, objects_dir):
+        self.dir = os.path.join(objects_dir, 'chunks')
+        self.path = os.path.join(self.dir, 'recipes.jsonl')
+        self.recipes = {}
+        self.file = None
+        self.tail = LogTail(self.path)
+        self.load()
+
+    def load(self):
+        """Read recipes added since the last call, all of them if the file
+        was rewritten in between"""
+        reset, entries = self.tail.read()
+        if reset:
+            self.recipes.clear()
+        for entry in entries:
+            self.recipes.update(entry)
+
+    def reload(self):
+        """Pick up recipes other processes added"""
+        self.close()
+        self.load()
+
+    def __contains__(self, digest):
+        return digest in self.recipes
+
+    def add(self, digest, chunks, st):
+        """Record a recipe, its chunks must already be stored"""
+        if digest in self.recipes:
+            return
+        self.add_recipe(digest, [sum(length for _, length in chunks),
+                                 st.st_mode & 0o7777, st.st_mtime_ns, chunks])
+
+    def add_recipe(self, digest, recipe):
+        """Record a complete [size, mode, mtime_ns, chunks] recipe"""
+        if digest in self.recipes:
+            return
+        if self.file is None:
+            os.makedirs(self.dir, exist_ok=True)
+            self.file = open(self.path, 'a')
+        self.recipes[digest] = recipe
+        self.file.write(json.dumps({digest: recipe}) + '\n')
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def rewrite(self, keep):
+        """Forget recipes whose digest is not in keep, returns how many went"""
+        dropped = [digest for digest in self.recipes if digest not in keep]
+        if not dropped:
+            return 0
+        for digest in dropped:
+            del self.recipes[digest]
+        self.close()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for digest, recipe in self.recipes.items():
+                f.write(json.dumps({digest: recipe}) + '\n')
+        os.replace(tmp, self.path)
+        return len(dropped)
+
+    def chunk_digests(self, digest):
+        return [chunk for chunk, _ in self.recipes[digest][3]]
+
+    def restore(self, digest, dst, read_object):
+        """Rebuild the file at dst from its chunks, read_object returns a chunk's bytes"""
+        _, mode, mtime_ns, chunks = self.recipes[digest]
+        with open(dst, 'wb') as f:
+            for chunk, _ in chunks:
+                f.write(read_object(chunk))
+        os.chmod(dst, mode)
+        os.utime(dst, ns=(mtime_ns, mtime_ns))
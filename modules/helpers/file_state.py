@@ -0,0 +1,332 @@
+from zlib import crc32
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping, ItemsView, ValuesView
+
+# Paths are stored in blocks: the first path of a block whole, the others
+# only from the directory they share with the path before them. A path starts
+# a block when its crc32 is 0 mod BLOCK_MASK + 1 (or MAX_BLOCK paths on), so
+# block boundaries depend on the paths alone and two states that differ in a
+# few places still have identical blocks everywhere else.
+BLOCK_MASK = 15
+MAX_BLOCK = 64
+# Overlays are merged into a new packed base once they hold more than
+# MIN_OVERLAY paths and 1/OVERLAY_RATIO of the base
+MIN_OVERLAY = 1024
+OVERLAY_RATIO = 8
+
+def encode_path(path):
+    # surrogatepass keeps any str encodable and byte order equal to str order
+    return path.encode('utf-8', 'surrogatepass')
+
+def decode_path(raw):
+    return raw.decode('utf-8', 'surrogatepass')
+
+def as_file_state(files):
+    return files if isinstance(files, FileState) else FileState(files)
+
+class PackedFiles:
+    """Sorted paths, front-coded by directory, and their digests packed as
+    raw bytes in one buffer. Digests that are not lowercase hex of the
+    common width (stat digests, legacy md5 next to blake2b) are kept aside."""
+
+    def __init__(self, items):
+        """items are (path, digest) pairs sorted by path"""
+        self.prefixes = prefixes = array('H')
+        self.offsets = offsets = array('I')
+        self.heads = heads = []
+        self.starts = starts = array('I')
+        blob = bytearray()
+        digests = bytearray()
+        self.odd = odd = {}
+        width = None
+        prev = b''
+        n = 0
+        for path, digest in items:
+            raw = encode_path(path)
+            if not crc32(raw) & BLOCK_MASK or n - (starts[-1] if starts else -MAX_BLOCK) >= MAX_BLOCK:
+                shared = 0
+                heads.append(raw)
+                starts.append(n)
+            else:
+                # Sorted neighbours mostly share their whole directory
+                shared = raw.rfind(b'/') + 1
+                while shared and not prev.startswith(raw[:shared]):
+                    shared = raw.rfind(b'/', 0, shared - 1) + 1
+            prefixes.append(shared)
+            offsets.append(len(blob))
+            blob += raw[shared:]
+            prev = raw
+
+            packed = None
+            if width is None and len(digest) % 2 == 0 or len(digest) == 2 * (width or 0):
+                try:
+                    packed = bytes.fromhex(digest)
+                except ValueError:
+                    pass
+                if packed is not None and packed.hex() != digest:
+                    packed = None
+            if packed is None:
+                odd[n] = digest
+                packed = bytes(width or 0)
+            elif width is None:
+                width = len(packed)
+                # Earlier entries were all odd, give them their zeroed slots
+                digests += bytes(len(packed) * n)
+            digests += packed
+            n += 1
+        offsets.append(len(blob))
+        starts.append(n)
+        self.count = n
+        self.width = width or 0
+        self.blob = bytes(blob)
+        self.digests = bytes(digests)
+
+    def same_as(self, other):
+        return self.count == other.count and self.digests == other.digests and \
+            self.blob == other.blob and self.prefixes == other.prefixes and self.odd == other.odd
+
+    def block(self, k):
+        """Everything stored for block k, equal only for identical blocks"""
+        start, end = self.starts[k], self.starts[k + 1]
+        w = self.width
+        odd = [(i - start, self.odd[i]) for i in self.odd if start <= i < end] if self.odd else None
+        return (self.blob[self.offsets[start]:self.offsets[end]], self.prefixes[start:end],
+                self.digests[start * w:end * w], odd)
+
+    def entries(self, start=0):
+        """(raw path, index) from index start, which must start a block"""
+        prefixes, offsets, blob = self.prefixes, self.offsets, self.blob
+        prev = b''
+        for i in range(start, self.count):
+            prev = prev[:prefixes[i]] + blob[offsets[i]:offsets[i + 1]]
+            yield prev, i
+
+    def digest(self, i):
+        if i in self.odd:
+            return self.odd[i]
+        w = self.width
+        return self.digests[i * w:i * w + w].hex()
+
+    def find(self, raw):
+        """Index of raw path, -1 if absent"""
+        block = bisect_right(self.heads, raw) - 1
+        if block < 0:
+            return -1
+        prefixes, offsets, blob = self.prefixes, self.offsets, self.blob
+        cur = b''
+        for i in range(self.starts[block], self.starts[block + 1]):
+            cur = cur[:prefixes[i]] + blob[offsets[i]:offsets[i + 1]]
+            if cur >= raw:
+                return i if cur == raw else -1
+        return -1
+
+    def items(self, start=0):
+        odd, digests, w = self.odd, self.digests, self.width
+        for raw, i in self.entries(start):
+            yield decode_path(raw), odd[i] if i in odd else digests[i * w:i * w + w].hex()
+
+    def items_from(self, path):
+        """Sorted (path, digest) pairs from the first path >= path"""
+        block = max(bisect_right(self.heads, encode_path(path)) - 1, 0)
+        for item in self.items(self.starts[block] if self.heads else 0):
+            if item[0] >= path:
+                yield item
+
+    def values(self):
+        odd, digests, w = self.odd, self.digests, self.width
+        for i in range(self.count):
+            yield odd[i] if i in odd else digests[i * w:i * w + w].hex()
+
+def diff_packed(old, new):
+    """(changed, deleted) between two packed bases in one merge pass that
+    skips the blocks both have unchanged"""
+    changed = {}
+    deleted = []
+    i = j = 0  # next entry of each side
+    bi = bj = 0  # next block of each side
+    ca = cb = None  # raw path of entry i / j once decoded
+    pa = pb = b''
+    while i < old.count or j < new.count:
+        if ca is None and cb is None and i == old.starts[bi] and j == new.starts[bj] and \
+                i < old.count and j < new.count and \
+                old.heads[bi] == new.heads[bj] and old.block(bi) == new.block(bj):
+            bi += 1
+            bj += 1
+            i = old.starts[bi]
+            j = new.starts[bj]
+            continue
+        if ca is None and i < old.count:
+            if i == old.starts[bi]:
+                bi += 1
+                pa = b''
+            ca = pa[:old.prefixes[i]] + old.blob[old.offsets[i]:old.offsets[i + 1]]
+        if cb is None and j < new.count:
+            if j == new.starts[bj]:
+                bj += 1
+                pb = b''
+            cb = pb[:new.prefixes[j]] + new.blob[new.offsets[j]:new.offsets[j + 1]]
+        if cb is None or ca is not None and ca < cb:
+            deleted.append(decode_path(ca))
+            pa, ca = ca, None
+            i += 1
+        elif ca is None or ca > cb:
+            changed[decode_path(cb)] = new.digest(j)
+            pb, cb = cb, None
+            j += 1
+        else:
+            digest = new.digest(j)
+            if old.digest(i) != digest:
+                changed[decode_path(cb)] = digest
+            pa, ca = ca, None
+            pb, cb = cb, None
+            i += 1
+            j += 1
+    return changed, deleted
+
+class FileStateItems(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+class FileStateValues(ValuesView):
+    def __iter__(self):
+        return self._mapping.iter_values()
+
+class FileState(Mapping):
+    """Immutable path -> digest map of a whole tree.
+
+    Takes a fraction of the memory of a dict of strings and iterates in
+    path order, so two states diff in one merge pass over their packed
+    blocks. updated() layers small changes over the same packed base, and
+    diffing states that share a base only looks at those changes."""
+
+    def __init__(self, files=()):
+        if isinstance(files, FileState):
+            items = files.iter_items()
+        else:
+            items = sorted(files.items() if isinstance(files, Mapping) else files)
+        self.base = PackedFiles(items)
+        self.overlay = {}  # path -> digest, None for paths removed from base
+        self.length = self.base.count
+
+    @classmethod
+    def layered(cls, base, overlay, length):
+        state = cls.__new__(cls)
+        state.base = base
+        state.overlay = overlay
+        state.length = length
+        return state
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, path):
+        if path in self.overlay:
+            digest = self.overlay[path]
+        else:
+            i = self.base.find(encode_path(path))
+            digest = self.base.digest(i) if i >= 0 else None
+        if digest is None:
+            raise KeyError(path)
+        return digest
+
+    def __contains__(self, path):
+        if path in self.overlay:
+            return self.overlay[path] is not None
+        return isinstance(path, str) and self.base.find(encode_path(path)) >= 0
+
+    def __iter__(self):
+        return (path for path, _ in self.iter_items())
+
+    def items(self):
+        return FileStateItems(self)
+
+    def values(self):
+        return FileStateValues(self)
+
+    def iter_items(self):
+        if not self.overlay:
+            yield from self.base.items()
+            return
+        pending = sorted(self.overlay.items())
+        j = 0
+        for path, digest in self.base.items():
+            while j < len(pending) and pending[j][0] < path:
+                if pending[j][1] is not None:
+                    yield pending[j]
+                j += 1
+            if j < len(pending) and pending[j][0] == path:
+                # Replaced or removed by the overlay
+                if pending[j][1] is not None:
+                    yield pending[j]
+                j += 1
+            else:
+                yield path, digest
+        for item in pending[j:]:
+            if item[1] is not None:
+                yield item
+
+    def iter_values(self):
+        if not self.overlay:
+            return self.base.values()
+        return (digest for _, digest in self.iter_items())
+
+    def under(self, directory):
+        """Paths equal to directory or below it"""
+        prefix = directory + '/'
+        found = [path for path, digest in self.overlay.items() if digest is not None and
+                 (path == directory or path.startswith(prefix))]
+        for path, _ in self.base.items_from(directory):
+            if not path.startswith(directory):
+                break
+            if (path == directory or path.startswith(prefix)) and path not in self.overlay:
+                found.append(path)
+        return found
+
+    def updated(self, changed=None, deleted=()):
+        """New state with deleted paths removed, then changed ones set"""
+        base = self.base
+        overlay = dict(self.overlay)
+        length = self.length
+
+        def present(path):
+            if path in overlay:
+                return overlay[path] is not None
+            return base.find(encode_path(path)) >= 0
+
+        for path in deleted:
+            if present(path):
+                overlay[path] = None
+                length -= 1
+        for path, digest in (changed or {}).items():
+            if not present(path):
+                length += 1
+            overlay[path] = digest
+        state = FileState.layered(base, overlay, length)
+        if len(overlay) > max(MIN_OVERLAY, base.count // OVERLAY_RATIO):
+            state = FileState(state)
+        return state
+
+    def diff(self, new):
+        """(changed, deleted) from this state to new: paths added or modified
+        in new with their digests, and paths gone from this one"""
+        changed = {}
+        deleted = []
+        if new is self or not self.overlay and not new.overlay and self.base.same_as(new.base):
+            return changed, deleted
+        layered = self.overlay.keys() | new.overlay.keys()
+        if new.base is not self.base:
+            # Paths in neither overlay differ exactly as the bases do
+            changed, deleted = diff_packed(self.base, new.base)
+            for path in layered:
+                changed.pop(path, None)
+            deleted = [path for path in deleted if path not in layered]
+        for path in sorted(layered):
+            before = self.get(path)
+            after = new.get(path)
+            if after is None:
+                if before is not None:
+                    deleted.append(path)
+            elif after != before:
+                changed[path] = after
+        return changed, deleted
@@ -0,0 +1,94 @@
+import os
+import re
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 1024 * 1024
+ALGORITHMS = ('blake2b', 'sha256', 'md5')
+# Hex digits in a digest of each algorithm
+DIGEST_LENGTHS = {'blake2b': 64, 'sha256': 64, 'md5': 32}
+
+# Digests of files above the size cap are built from stat data and carry
+# this prefix so they can never collide with a content hash. They also name
+# the file's path, two files of the same size and mtime are different objects.
+STAT_PREFIX = 'stat-'
+STAT_DIGEST = re.compile(r'stat-([0-9a-f]+)-[0-9a-f]+(-[0-9a-f]{16})?')
+
+def new_hash(algorithm):
+    if algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=32)
+    if algorithm in ALGORITHMS:
+        return hashlib.new(algorithm)
+    raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+
+def hash_file(path, algorithm='blake2b', buf=None):
+    """Stream path through the hash in fixed-size chunks, reusing buf if given"""
+    h = new_hash(algorithm)
+    view = memoryview(buf if buf is not None else bytearray(CHUNK_SIZE))
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(view)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+def stat_digest(st, rel_path):
+    path_hash = hashlib.blake2b(os.fsencode(rel_path), digest_size=8).hexdigest()
+    return f"{STAT_PREFIX}{st.st_size:x}-{st.st_mtime_ns:x}-{path_hash}"
+
+def is_stat_digest(digest):
+    return digest.startswith(STAT_PREFIX)
+
+def stat_digest_size(digest):
+    return int(STAT_DIGEST.fullmatch(digest).group(1), 16)
+
+def is_valid_digest(digest, algorithm):
+    """Whether digest is one algorithm could have named an object with,
+    anything else must never reach a path in the store"""
+    if not isinstance(digest, str):
+        return False
+    if digest.startswith(STAT_PREFIX):
+        return STAT_DIGEST.fullmatch(digest) is not None
+    return len(digest) == DIGEST_LENGTHS.get(algorithm) and \
+        all(c in '0123456789abcdef' for c in digest)
+
+class FileHasher:
+    """Hashes files on a thread pool, hashlib releases the GIL while hashing"""
+
+    def __init__(self, algorithm='blake2b', max_size=None, workers=None):
+        new_hash(algorithm)
+        self.algorithm = algorithm
+        self.max_size = max_size  # bytes, None hashes everything
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.local = threading.local()
+        self.pool = None
+
+    def buffer(self):
+        buf = getattr(self.local, 'buf', None)
+        if buf is None:
+            buf = self.local.buf = bytearray(CHUNK_SIZE)
+        return buf
+
+    def digest(self, path, st, rel_path):
+        """Digest for path, or None if it could not be read"""
+        if self.max_size is not None and st.st_size > self.max_size:
+            return stat_digest(st, rel_path)
+        try:
+            return hash_file(path, self.algorithm, self.buffer())
+        except OSError:
+            return None
+
+    def digest_many(self, jobs):
+        """Digests for a list of (path, stat, rel_path) in the same order"""
+        if len(jobs) < 2 or self.workers < 2:
+            return [self.digest(*job) for job in jobs]
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix='sftm-hash')
+        return list(self.pool.map(lambda job: self.digest(*job), jobs))
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
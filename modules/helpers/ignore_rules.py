@@ -0,0 +1,141 @@
+import os
+import re
+
+IGNORE_FILES = ('.gitignore', '.sftmignore')
+
+def glob_to_regex(pattern):
+    """Regex source for a gitignore glob, '/' separated and without anchors"""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                # '**/' matches zero or more directories, a trailing '**' everything
+                if pattern.startswith('**/', i):
+                    out.append('(?:.*/)?')
+                    i += 3
+                else:
+                    out.append('.*')
+                    i += 2
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            start = i + 2 if pattern[i + 1:i + 2] in ('!', '^') else i + 1
+            # A ']' right after the opening bracket is part of the class
+            end = pattern.find(']', start + 1)
+            if end < 0:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body[0] in '!^':
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+def parse_rule(line):
+    """(negated, dir_only, regex source) for one ignore file line, or None"""
+    line = line.rstrip('\n')
+    if not line.endswith('\\ '):
+        line = line.rstrip()
+    if not line or line.startswith('#'):
+        return None
+    negated = line.startswith('!')
+    if negated or line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    # A slash anywhere but the end anchors the pattern to the project root,
+    # otherwise it matches a name at any depth
+    anchored = '/' in line
+    source = glob_to_regex(line.lstrip('/'))
+    if not anchored:
+        source = '(?:.*/)?' + source
+    return negated, dir_only, source
+
+class IgnoreMatcher:
+    """Decides which paths SFTM skips.
+
+    Built from fixed directory names and extensions plus the project's
+    .gitignore and .sftmignore. Consecutive rules with the same sign are
+    compiled into one regex, so a lookup costs a set probe and a few regex
+    matches whatever the number of rules. Paths are relative to the root
+    and checked top down by the walk, a path below an ignored directory is
+    never asked about."""
+
+    def __init__(self, root, ignore_dirs=(), ignore_extensions=(), ignore_files=IGNORE_FILES):
+        self.root = root
+        self.ignore_dirs = frozenset(ignore_dirs)
+        self.ignore_extensions = tuple(ignore_extensions)
+        self.ignore_files = ignore_files
+        self.blocks = []
+        self.signature = None
+        self.refresh()
+
+    def file_signature(self):
+        signature = []
+        for name in self.ignore_files:
+            try:
+                st = os.stat(os.path.join(self.root, name))
+                signature.append((name, st.st_size, st.st_mtime_ns))
+            except OSError:
+                signature.append((name, None, None))
+        return tuple(signature)
+
+    def refresh(self):
+        """Recompile when an ignore file changed, returns whether it did"""
+        signature = self.file_signature()
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        rules = []
+        for name in self.ignore_files:
+            try:
+                with open(os.path.join(self.root, name), encoding='utf-8',
+                          errors='replace') as f:
+                    rules.extend(filter(None, map(parse_rule, f)))
+            except OSError:
+                continue
+        self.blocks = self.compile(rules)
+        return True
+
+    @staticmethod
+    def compile(rules):
+        """Group rules into (negated, any_regex, dir_regex) blocks, last block first"""
+        blocks = []
+        for negated, dir_only, source in rules:
+            if not blocks or blocks[-1][0] != negated:
+                blocks.append((negated, [], []))
+            blocks[-1][2 if dir_only else 1].append(source)
+        compiled = []
+        for negated, any_sources, dir_sources in reversed(blocks):
+            compiled.append((negated,
+                             re.compile('|'.join(any_sources)) if any_sources else None,
+                             re.compile('|'.join(dir_sources)) if dir_sources else None))
+        return compiled
+
+    def __call__(self, rel_path, is_dir=False):
+        name = rel_path.rpartition(os.sep)[2]
+        if name in self.ignore_dirs or name.endswith(self.ignore_extensions):
+            return True
+        if not self.blocks:
+            return False
+        if os.sep != '/':
+            rel_path = rel_path.replace(os.sep, '/')
+        # The last matching rule decides, so later blocks are tried first
+        for negated, any_re, dir_re in self.blocks:
+            if any_re is not None and any_re.fullmatch(rel_path) or \
+                    is_dir and dir_re is not None and dir_re.fullmatch(rel_path):
+                return not negated
+        return False
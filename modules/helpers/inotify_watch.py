@@ -0,0 +1,145 @@
+import os
+import sys
+import errno
+import struct
+import ctypes
+import ctypes.util
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF |
+              IN_ONLYDIR | IN_DONT_FOLLOW)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+class WatchLimitError(OSError):
+    """Raised when fs.inotify.max_user_watches is exhausted"""
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+class InotifyWatcher:
+    """Recursive inotify watch over a tree, reporting which paths may have changed"""
+
+    def __init__(self, root, should_ignore):
+        self.root = root
+        self.should_ignore = should_ignore
+        self.libc = None
+        self.fd = -1
+        self.watches = {}  # wd -> directory relative to root ('' for root)
+
+    def start(self):
+        """Set up watches for the whole tree, raises OSError if inotify is unusable"""
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self.libc = _load_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        try:
+            self.add_tree('')
+        except OSError:
+            self.close()
+            raise
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+        self.fd = -1
+        self.watches.clear()
+
+    def add_watch(self, rel_dir):
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise WatchLimitError(err, "inotify watch limit reached")
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return None
+            raise OSError(err, os.strerror(err))
+        self.watches[wd] = rel_dir
+        return wd
+
+    def add_tree(self, rel_dir):
+        """Watch rel_dir and every non-ignored directory below it"""
+        if self.add_watch(rel_dir) is None:
+            return
+        top = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        for root, dirs, _ in os.walk(top):
+            rel_root = os.path.relpath(root, self.root)
+            if rel_root == '.':
+                rel_root = ''
+            dirs[:] = [d for d in dirs
+                       if not self.should_ignore(os.path.join(rel_root, d), True)]
+            for d in dirs:
+                self.add_watch(os.path.join(rel_root, d))
+
+    def read_events(self):
+        """Drain pending events.
+
+        Returns a set of relative paths (files or directories) that may have
+        changed, or None when the kernel queue overflowed and a full rescan
+        is needed."""
+        paths = set()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                rel_dir = self.watches.get(wd)
+                if rel_dir is None:
+                    continue
+                if mask & IN_IGNORED:
+                    del self.watches[wd]
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    paths.add(rel_dir)
+                    continue
+
+                rel_path = os.path.join(rel_dir, name) if rel_dir else name
+                if self.should_ignore(rel_path, bool(mask & IN_ISDIR)):
+                    continue
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    # New directories need their own watches, anything already
+                    # inside them is picked up by walking the reported path
+                    self.add_tree(rel_path)
+                paths.add(rel_path)
+        return None if overflow else paths
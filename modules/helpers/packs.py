@@ -0,0 +1,215 @@
+import os
+import json
+import mmap
+import zlib
+import lzma
+from helpers.store_lock import LogTail
+
+CODECS = ('zlib', 'lzma')
+
+# Objects up to this size are appended to packs instead of getting a file each
+PACK_OBJECT_LIMIT = 64 * 1024
+# A new pack is started once the current one reaches this size
+MAX_PACK_SIZE = 64 * 1024 * 1024
+
+def compress(data, codec, level):
+    if codec == 'zlib':
+        return zlib.compress(data, level)
+    if codec == 'lzma':
+        return lzma.compress(data, preset=level)
+    raise ValueError(f"Unsupported pack codec: {codec}")
+
+def decompress(data, codec):
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    return lzma.decompress(data)
+
+class PackStore:
+    """Small objects appended to compressed pack files.
+
+    Every object is compressed on its own, so reading one back only touches
+    its own bytes of the mmapped pack. index.jsonl maps each digest to
+    [pack, offset, length, size, codec, mode, mtime_ns]."""
+
+    def __init__(self, objects_dir, object_limit=PACK_OBJECT_LIMIT,
+                 max_pack_size=MAX_PACK_SIZE, codec='zlib', level=6):
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported pack codec: {codec}")
+        self.pack_dir = os.path.join(objects_dir, 'pack')
+        self.index_path = os.path.join(self.pack_dir, 'index.jsonl')
+        self.object_limit = object_limit
+        self.max_pack_size = max_pack_size
+        self.codec = codec
+        self.level = level
+        self.index = {}
+        self.maps = {}
+        self.pack = None
+        self.pack_name = None
+        self.index_file = None
+        self.tail = LogTail(self.index_path)
+        self.load_index()
+
+    def load_index(self):
+        """Read index lines added since the last call, all of them if the
+        index was compacted in between"""
+        reset, entries = self.tail.read()
+        if reset:
+            self.index.clear()
+            for mapped in self.maps.values():
+                mapped.close()
+            self.maps.clear()
+        sizes = {}
+        for entry in entries:
+            for digest, (pack, offset, length, *rest) in entry.items():
+                if pack not in sizes:
+                    try:
+                        sizes[pack] = os.path.getsize(os.path.join(self.pack_dir, pack))
+                    except OSError:
+                        sizes[pack] = 0
+                # Entries past the end of the pack were never flushed
+                if offset + length <= sizes[pack]:
+                    self.index[digest] = [pack, offset, length, *rest]
+
+    def reload(self):
+        """Pick up objects other processes packed. The pack is reopened on
+        the next append, at its real end or as a new pack if another
+        process started one."""
+        self.close()
+        self.load_index()
+
+    def __contains__(self, digest):
+        return digest in self.index
+
+    def accepts(self, size):
+        return size <= self.object_limit
+
+    def pack_names(self):
+        try:
+            return sorted(n for n in os.listdir(self.pack_dir) if n.endswith('.pack'))
+        except FileNotFoundError:
+            return []
+
+    def open_pack(self, fresh=False):
+        """Append to the last pack, or start a new one if it is full or fresh is set"""
+        os.makedirs(self.pack_dir, exist_ok=True)
+        names = self.pack_names()
+        number = max((int(n[5:-5]) for n in names), default=-1)
+        if names and not fresh:
+            last = f"pack-{number:06d}.pack"
+            if os.path.getsize(os.path.join(self.pack_dir, last)) < self.max_pack_size:
+                self.pack_name = last
+                self.pack = open(os.path.join(self.pack_dir, last), 'ab')
+                return
+        self.pack_name = f"pack-{number + 1:06d}.pack"
+        self.pack = open(os.path.join(self.pack_dir, self.pack_name), 'ab')
+
+    def add(self, digest, data, st=None):
+        """Append data under digest, returns the number of bytes added to disk"""
+        if digest in self.index:
+            return 0
+        packed = compress(data, self.codec, self.level)
+        self.append(digest, packed, [len(data), self.codec, st.st_mode & 0o7777 if st else 0o644,
+                                     st.st_mtime_ns if st else None])
+        return len(packed)
+
+    def append(self, digest, packed, details, fresh=False):
+        """Write already compressed bytes, details is [size, codec, mode, mtime_ns]"""
+        if self.pack is None or self.pack.tell() >= self.max_pack_size or fresh:
+            self.close()
+            self.open_pack(fresh)
+        if self.index_file is None:
+            self.index_file = open(self.index_path, 'a')
+        offset = self.pack.tell()
+        self.pack.write(packed)
+        entry = [self.pack_name, offset, len(packed), *details]
+        self.index[digest] = entry
+        self.index_file.write(json.dumps({digest: entry}) + '\n')
+
+    def flush(self):
+        # Pack data first, so a flushed index line never points at missing bytes
+        if self.pack is not None:
+            self.pack.flush()
+        if self.index_file is not None:
+            self.index_file.flush()
+
+    def close(self):
+        self.flush()
+        if self.pack is not None:
+            self.pack.close()
+            self.pack = None
+        if self.index_file is not None:
+            self.index_file.close()
+            self.index_file = None
+
+    def repack(self, keep, min_dead=0.25):
+        """Drop objects whose digest is not in keep. Packs that are mostly
+        live are left alone, the others have their live objects copied to a
+        new pack and are deleted. Yields after each pack so the caller can
+        spread the work out, keep may grow in between."""
+        self.close()
+        packs = {}
+        for digest, entry in self.index.items():
+            packs.setdefault(entry[0], []).append(digest)
+        reclaimed = 0
+        started = False
+        for pack in sorted(packs):
+            digests = [d for d in packs[pack] if self.index.get(d, (None,))[0] == pack]
+            live = [d for d in digests if d in keep]
+            dead = [d for d in digests if d not in keep]
+            dead_bytes = sum(self.index[d][2] for d in dead)
+            if not dead or dead_bytes < sum(self.index[d][2] for d in digests) * min_dead:
+                continue
+            # Copies go to a pack of their own, never into one being emptied
+            for digest in live:
+                _, offset, length, *details = self.index[digest]
+                packed = self.view(pack, offset + length)[offset:offset + length]
+                self.append(digest, packed, details, fresh=not started)
+                started = True
+            for digest in dead:
+                del self.index[digest]
+            self.flush()
+            mapped = self.maps.pop(pack, None)
+            if mapped is not None:
+                mapped.close()
+            os.remove(os.path.join(self.pack_dir, pack))
+            reclaimed += dead_bytes
+            yield pack
+        if reclaimed:
+            self.compact_index()
+        return reclaimed
+
+    def compact_index(self):
+        """Rewrite index.jsonl with only the current entries"""
+        self.close()
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            for digest, entry in self.index.items():
+                f.write(json.dumps({digest: entry}) + '\n')
+        os.replace(tmp, self.index_path)
+
+    def view(self, pack, end):
+        mapped = self.maps.get(pack)
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            if pack == self.pack_name:
+                self.flush()
+            with open(os.path.join(self.pack_dir, pack), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[pack] = mapped
+        return mapped
+
+    def read(self, digest):
+        pack, offset, length, _, codec = self.index[digest][:5]
+        mapped = self.view(pack, offset + length)
+        return decompress(mapped[offset:offset + length], codec)
+
+    def restore(self, digest, dst):
+        """Write the object to dst with the mode and mtime it was saved with"""
+        _, _, _, _, _, mode, mtime_ns = self.index[digest]
+        data = self.read(digest)
+        with open(dst, 'wb') as f:
+            f.write(data)
+        os.chmod(dst, mode)
+        if mtime_ns is not None:
+            os.utime(dst, ns=(mtime_ns, mtime_ns))
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+def save_time(save_id):
+    """When a save was taken, from ids like 20250120_143858 or 20250120_143858_2"""
+    try:
+        return datetime.strptime(save_id[:15], "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+def is_autosave(entry):
+    return entry.get('comment', '').startswith('Autosave')
+
+class RetentionPolicy:
+    """Which saves to keep: everything from the last keep_all seconds, the
+    newest save of each hour for hourly seconds and of each day for daily
+    seconds. Older saves are dropped, and the oldest remaining ones go too
+    while the store is above max_bytes (None for no budget).
+
+    Manual saves are only dropped for the budget when keep_manual is set,
+    and the newest save is always kept."""
+
+    def __init__(self, enabled=False, keep_all=3600, hourly=24 * 3600, daily=30 * 24 * 3600,
+                 max_bytes=None, keep_manual=True):
+        self.enabled = enabled
+        self.keep_all = keep_all
+        self.hourly = hourly
+        self.daily = daily
+        self.max_bytes = max_bytes
+        self.keep_manual = keep_manual
+
+    def expired(self, entries, now=None, protected=()):
+        """Ids the time rules drop, entries are catalogue entries oldest first"""
+        now = now or datetime.now()
+        hours = set()
+        days = set()
+        drop = []
+        for n, entry in enumerate(reversed(entries)):
+            taken = save_time(entry['id'])
+            if n == 0 or taken is None or entry['id'] in protected or \
+                    self.keep_manual and not is_autosave(entry):
+                continue
+            age = (now - taken).total_seconds()
+            if age <= self.keep_all:
+                continue
+            # Walking newest first, the first save seen in a bucket is its newest
+            if age <= self.hourly:
+                bucket, seen = taken.strftime("%Y%m%d%H"), hours
+            elif age <= self.daily:
+                bucket, seen = taken.strftime("%Y%m%d"), days
+            else:
+                drop.append(entry['id'])
+                continue
+            if bucket in seen:
+                drop.append(entry['id'])
+            seen.add(bucket)
+        return drop
+
+    def over_budget(self, entries, usage, protected=(), reclaimable=None):
+        """Oldest ids to drop for a store using usage bytes to fit max_bytes.
+
+        reclaimable maps a save to the bytes that only it and older saves
+        reference, saves missing from it count the bytes they added. Both are
+        estimates, the collector measures again afterwards and repeats if needed."""
+        if self.max_bytes is None or usage <= self.max_bytes:
+            return []
+        reclaimable = reclaimable or {}
+        excess = usage - self.max_bytes
+        drop = []
+        for entry in entries[:-1]:
+            if entry['id'] in protected:
+                continue
+            drop.append(entry['id'])
+            excess -= reclaimable.get(entry['id'], entry.get('bytes') or 0)
+            if excess <= 0:
+                break
+        return drop
@@ -0,0 +1,339 @@
+import io
+import os
+import json
+import tarfile
+from types import SimpleNamespace
+from helpers.snapshot_store import LEGACY_FORMAT, STORE_FORMAT, is_delta
+from helpers.hashing import (CHUNK_SIZE, ALGORITHMS, new_hash, is_stat_digest,
+                             stat_digest_size, is_valid_digest)
+from helpers.file_state import FileState
+
+# An archive is a tar stream of, in this order: a header naming the saves,
+# every object they need (chunks before the recipe that lists them), then one
+# manifest per save. Readers never seek, so archives can be piped, and a
+# truncated stream never leaves a save whose objects did not all arrive.
+ARCHIVE_VERSION = 1
+HEADER_NAME = 'sftm-archive.json'
+COMPRESSIONS = ('', 'gz', 'bz2', 'xz')
+# Exact mtime of an object and the algorithm that named it, as pax headers
+MTIME_KEY = 'SFTM.mtime_ns'
+ALGORITHM_KEY = 'SFTM.algorithm'
+
+def compression_for(path):
+    """Compression implied by an archive file name"""
+    for suffixes, compression in (('.tgz', '.gz'), 'gz'), (('.bz2', '.tbz2'), 'bz2'), \
+                                 (('.xz', '.txz'), 'xz'):
+        if path.endswith(suffixes):
+            return compression
+    return ''
+
+def json_member(tar, name, value, pax_headers=None):
+    data = json.dumps(value).encode()
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    if pax_headers:
+        info.pax_headers = pax_headers
+    tar.addfile(info, io.BytesIO(data))
+
+def check_digest(digest, algorithm):
+    # Digests name files in the store, a crafted one could point anywhere
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown hash algorithm {algorithm!r} in the archive")
+    if not is_valid_digest(digest, algorithm):
+        raise ValueError(f"Invalid object name {digest!r} in the archive")
+
+def check_path(path):
+    # Restores join saved paths onto the working directory
+    if not isinstance(path, str) or os.path.isabs(path) or os.path.splitdrive(path)[0] or \
+            any(part in ('', '.', '..') for part in path.replace('\\', '/').split('/')):
+        raise ValueError(f"Unsafe file path {path!r} in the archive")
+
+def is_save_id(value):
+    """Whether value can name a directory directly inside .saves"""
+    return isinstance(value, str) and bool(value) and not value.startswith('.') and \
+        '/' not in value and '\\' not in value
+
+def check_save_id(save_id):
+    if not is_save_id(save_id):
+        raise ValueError(f"Invalid save id {save_id!r} in the archive")
+
+class ArchiveWriter:
+    """Streams saves and their objects into a tar, each object once"""
+
+    def __init__(self, store, fileobj, compression=''):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression: {compression}")
+        self.store = store
+        self.tar = tarfile.open(fileobj=fileobj, mode=f"w|{compression}",
+                                format=tarfile.PAX_FORMAT)
+        self.written = set()
+        self.objects = 0
+        self.bytes = 0
+        self.missing = 0
+
+    def write(self, save_ids, base=None):
+        """Archive save_ids, oldest first. base is a save the destination
+        already has: deltas on it stay deltas and its objects are left out."""
+        store = self.store
+        exported = set()
+        if base is not None:
+            exported.add(base)
+            self.written.update(store.load_files(base).values())
+        json_member(self.tar, HEADER_NAME, {'version': ARCHIVE_VERSION,
+                                            'saves': list(save_ids), 'base': base})
+        manifests = []
+        for save_id in save_ids:
+            meta = store.read_manifest(save_id)
+            algorithm = meta.get('algorithm', 'md5')
+            if is_delta(meta) and meta.get('parent') in exported:
+                # Everything else it references came with its parent
+                for digest in meta['changed'].values():
+                    self.add_object(digest, algorithm)
+            else:
+                # Full manifests, deltas on saves left behind and old
+                # full-copy saves all travel as full store manifests
+                legacy = meta.get('format', LEGACY_FORMAT) == LEGACY_FORMAT
+                files = store.load_files(save_id)
+                for path, digest in files.items():
+                    self.add_object(digest, algorithm, os.path.join(store.saves_dir, save_id, path)
+                                    if legacy else None)
+                meta = dict(meta, format=STORE_FORMAT, algorithm=algorithm, depth=0,
+                            files=dict(files.items()))
+                meta.pop('changed', None)
+                meta.pop('deleted', None)
+            manifests.append((save_id, meta))
+            exported.add(save_id)
+        for save_id, meta in manifests:
+            json_member(self.tar, f"saves/{save_id}/meta.json", meta)
+
+    def add_object(self, digest, algorithm, source=None):
+        """Add one object, source is the file holding it outside the object store"""
+        if digest in self.written:
+            return
+        self.written.add(digest)
+        store = self.store
+        info = tarfile.TarInfo(f"objects/{digest}")
+        info.pax_headers = {ALGORITHM_KEY: algorithm}
+        if source is None and store.packs is not None and digest in store.packs:
+            data = store.packs.read(digest)
+            _, _, _, _, _, mode, mtime_ns = store.packs.index[digest]
+            self.add_member(info, len(data), mode, mtime_ns, io.BytesIO(data))
+            return
+        if source is None and digest in store.chunks:
+            for chunk in store.chunks.chunk_digests(digest):
+                self.add_object(chunk, algorithm)
+            json_member(self.tar, f"recipes/{digest}", store.chunks.recipes[digest],
+                        {ALGORITHM_KEY: algorithm})
+            return
+        try:
+            with open(source or store.object_path(digest), 'rb') as f:
+                st = os.fstat(f.fileno())
+                self.add_member(info, st.st_size, st.st_mode & 0o7777, st.st_mtime_ns, f)
+        except FileNotFoundError:
+            self.missing += 1
+
+    def add_member(self, info, size, mode, mtime_ns, fileobj):
+        info.size = size
+        info.mode = mode
+        if mtime_ns is not None:
+            info.mtime = mtime_ns / 1e9
+            info.pax_headers[MTIME_KEY] = str(mtime_ns)
+        self.tar.addfile(info, fileobj)
+        self.objects += 1
+        self.bytes += size
+
+    def close(self):
+        self.tar.close()
+
+class ArchiveReader:
+    """Reads an archive into a store, skipping objects the store already has"""
+
+    def __init__(self, store, fileobj):
+        self.store = store
+        self.tar = tarfile.open(fileobj=fileobj, mode='r|*')
+        self.ids = {}  # save id in the archive -> save id in the store
+        self.saves = []
+        self.objects = 0
+        self.skipped = 0
+        self.bytes = 0
+
+    def read(self):
+        """Import everything, returns the ids of the saves written"""
+        header = None
+        for info in self.tar:
+            if header is None:
+                header = self.read_header(info)
+            elif info.name.startswith('objects/'):
+                self.read_object(info)
+            elif info.name.startswith('recipes/'):
+                self.read_recipe(info)
+            elif info.name.startswith('saves/') and info.name.endswith('/meta.json'):
+                self.read_manifest(info.name.split('/')[1], json.load(self.tar.extractfile(info)))
+        if header is None:
+            raise ValueError("Empty archive")
+        return self.saves
+
+    def read_header(self, info):
+        if info.name != HEADER_NAME:
+            raise ValueError(f"Not a save archive, starts with {info.name}")
+        header = json.load(self.tar.extractfile(info))
+        if header.get('version') != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported archive version {header.get('version')}")
+        base = header.get('base')
+        if base is not None:
+            check_save_id(base)
+            if self.store.try_read_manifest(base) is None:
+                raise ValueError(f"Archive is incremental on save {base}, which is not here")
+            self.ids[base] = base
+        return header
+
+    def read_object(self, info):
+        digest = info.name[len('objects/'):]
+        algorithm = info.pax_headers.get(ALGORITHM_KEY)
+        check_digest(digest, algorithm)
+        store = self.store
+        if store.has_object(digest):
+            self.skipped += 1
+            return
+        src = self.tar.extractfile(info)
+        # Objects named from stat data can only be checked by size
+        h = new_hash(algorithm) if not is_stat_digest(digest) else None
+        st = None
+        if MTIME_KEY in info.pax_headers:
+            mtime_ns = int(info.pax_headers[MTIME_KEY])
+            st = SimpleNamespace(st_mode=info.mode, st_mtime_ns=mtime_ns, st_atime_ns=mtime_ns)
+        if store.packs is not None and store.packs.accepts(info.size):
+            data = src.read()
+            if h is not None:
+                h.update(data)
+            self.check(h, digest, len(data))
+            store.put_data(data, digest, st)
+        else:
+            tmp = store.temp_path()
+            try:
+                size = 0
+                with open(tmp, 'wb') as f:
+                    while True:
+                        block = src.read(CHUNK_SIZE)
+                        if not block:
+                            break
+                        if h is not None:
+                            h.update(block)
+                        size += len(block)
+                        f.write(block)
+                self.check(h, digest, size)
+                if st is not None:
+                    os.chmod(tmp, st.st_mode)
+                    os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+                store.commit_temp(tmp, digest)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        self.objects += 1
+        self.bytes += info.size
+
+    @staticmethod
+    def check(h, digest, size):
+        """h holds the content hash, None for stat digests, which carry the size"""
+        if h is not None:
+            corrupt = h.hexdigest() != digest
+        else:
+            corrupt = size != stat_digest_size(digest)
+        if corrupt:
+            raise ValueError(f"Object {digest} is corrupt in the archive")
+
+    def read_recipe(self, info):
+        digest = info.name[len('recipes/'):]
+        algorithm = info.pax_headers.get(ALGORITHM_KEY)
+        check_digest(digest, algorithm)
+        store = self.store
+        if digest in store.chunks:
+            self.skipped += 1
+            return
+        recipe = json.load(self.tar.extractfile(info))
+        try:
+            size, mode, mtime_ns, chunks = recipe
+            for chunk, _ in chunks:
+                check_digest(chunk, algorithm)
+            if not isinstance(mode, int) or not isinstance(mtime_ns, int):
+                raise TypeError("mode and mtime must be integers")
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Recipe {digest} is malformed in the archive: {e}")
+        # Its chunks came first, the file they make up must hash to digest
+        h = new_hash(algorithm) if not is_stat_digest(digest) else None
+        total = 0
+        for chunk, length in chunks:
+            if not store.has_object(chunk):
+                raise ValueError(f"Recipe {digest} needs chunk {chunk}, missing from the archive")
+            data = store.read_object(chunk)
+            if len(data) != length:
+                raise ValueError(f"Recipe {digest} is corrupt in the archive")
+            if h is not None:
+                h.update(data)
+            total += length
+        self.check(h, digest, total)
+        if total != size:
+            raise ValueError(f"Recipe {digest} is corrupt in the archive")
+        store.chunks.add_recipe(digest, recipe)
+
+    @staticmethod
+    def check_manifest(save_id, meta):
+        check_save_id(save_id)
+        if not isinstance(meta, dict):
+            raise ValueError(f"Save {save_id} is malformed in the archive")
+        algorithm = meta.get('algorithm')
+        try:
+            if is_delta(meta):
+                entries = list(meta['changed'].items())
+                deleted = list(meta['deleted'])
+            else:
+                entries = list(meta['files'].items())
+                deleted = []
+        except (AttributeError, KeyError, TypeError) as e:
+            raise ValueError(f"Save {save_id} is malformed in the archive: {e}")
+        for path, digest in entries:
+            check_path(path)
+            check_digest(digest, algorithm)
+        for path in deleted:
+            check_path(path)
+        modes = meta.get('modes', {})
+        if not isinstance(modes, dict):
+            raise ValueError(f"Save {save_id} is malformed in the archive: bad modes")
+        for path, mode in modes.items():
+            check_path(path)
+            if not isinstance(mode, int) or not 0 <= mode <= 0o7777:
+                raise ValueError(f"Save {save_id} is malformed in the archive: bad mode for {path}")
+
+    def read_manifest(self, save_id, meta):
+        store = self.store
+        self.check_manifest(save_id, meta)
+        parent = meta.get('parent')
+        if is_delta(meta):
+            if parent not in self.ids:
+                raise ValueError(f"Save {save_id} is a delta on {parent}, which is not here")
+            meta['parent'] = self.ids[parent]
+            files = store.load_files(meta['parent']).updated(meta['changed'], meta['deleted'])
+            added = meta['changed'].values()
+        else:
+            if parent in self.ids:
+                meta['parent'] = self.ids[parent]
+            elif not is_save_id(parent) or store.try_read_manifest(parent) is None:
+                # Not a save this store has
+                meta['parent'] = None
+            files = meta['files'] = FileState(meta['files'])
+            added = files.values()
+        missing = sum(1 for digest in added if not store.has_object(digest))
+        if missing:
+            print(f"Warning: save {save_id} references {missing} objects missing from the archive")
+        if store.try_read_manifest(save_id) is not None and \
+                not any(store.load_files(save_id).diff(files)):
+            # Already here, from an earlier import of the same history
+            self.ids[save_id] = save_id
+            return
+        new_id = store.import_manifest(save_id, meta)
+        self.ids[save_id] = new_id
+        self.saves.append(new_id)
+
+    def close(self):
+        self.tar.close()
@@ -0,0 +1,114 @@
+import os
+import difflib
+from helpers.snapshot_store import diff_files
+from helpers.hashing import is_stat_digest, new_hash, hash_file
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+LABELS = {ADDED: 'New', MODIFIED: 'Modified', REMOVED: 'Deleted'}
+
+# Files above this size get no line diff, nor do files with a NUL byte in
+# their first BINARY_SNIFF bytes
+MAX_DIFF_SIZE = 1024 * 1024
+BINARY_SNIFF = 8192
+
+class FileChange:
+    """A path that differs between the two sides of a comparison"""
+    __slots__ = ('status', 'path', 'old_digest', 'new_digest')
+
+    def __init__(self, status, path, old_digest, new_digest):
+        self.status = status
+        self.path = path
+        self.old_digest = old_digest
+        self.new_digest = new_digest
+
+    def __str__(self):
+        return f"{LABELS[self.status]}: {self.path}"
+
+def compare_states(old_files, new_files):
+    """FileChanges from one path -> digest state to another, by path"""
+    changed, deleted = diff_files(old_files, new_files)
+    changes = [FileChange(REMOVED, path, old_files[path], None) for path in deleted]
+    for path, digest in changed.items():
+        old_digest = old_files.get(path)
+        changes.append(FileChange(MODIFIED if old_digest else ADDED, path, old_digest, digest))
+    changes.sort(key=lambda change: change.path)
+    return changes
+
+class SaveDiff:
+    """What changed from save old_id to save new_id, or to the working tree
+    when new_id is None.
+
+    The file list comes from the manifests alone, unless the two sides were
+    hashed with different algorithms: then files whose digests differ are
+    compared by content. Line diffs are only built by text_diff(), for the
+    files someone actually looks at."""
+
+    def __init__(self, store, cwd, old_id, new_id, old_files, new_files, algorithms=(None, None)):
+        self.store = store
+        self.cwd = cwd
+        self.old_id = old_id
+        self.new_id = new_id
+        self.changes = compare_states(old_files, new_files)
+        old_algorithm, new_algorithm = algorithms
+        if old_algorithm != new_algorithm:
+            self.changes = [change for change in self.changes if change.status != MODIFIED
+                            or not self.same_content(change, old_algorithm)]
+
+    def same_content(self, change, algorithm):
+        """Whether a modified file holds the same bytes on both sides, by
+        hashing the new side with the algorithm of the old digest"""
+        size = self.size(self.old_id, change.path, change.old_digest)
+        if size is None or size != self.size(self.new_id, change.path, change.new_digest):
+            return False
+        try:
+            if self.new_id is None:
+                digest = hash_file(os.path.join(self.cwd, change.path), algorithm)
+            else:
+                h = new_hash(algorithm)
+                h.update(self.read(self.new_id, change.path))
+                digest = h.hexdigest()
+        except (OSError, KeyError, ValueError):
+            return False
+        return digest == change.old_digest
+
+    def size(self, save_id, path, digest):
+        if is_stat_digest(digest):
+            return None  # only ever above the hashing size cap
+        if save_id is None:
+            try:
+                return os.path.getsize(os.path.join(self.cwd, path))
+            except OSError:
+                return None
+        return self.store.saved_size(save_id, path)
+
+    def read(self, save_id, path):
+        if save_id is None:
+            with open(os.path.join(self.cwd, path), 'rb') as f:
+                return f.read()
+        return self.store.read_saved(save_id, path)
+
+    def text_diff(self, change, context=3):
+        """Unified diff lines for change, or a single line saying why there is none"""
+        sides = []
+        for save_id, digest in ((self.old_id, change.old_digest), (self.new_id, change.new_digest)):
+            if digest is None:
+                sides.append(b'')
+                continue
+            size = self.size(save_id, change.path, digest)
+            if size is None or size > MAX_DIFF_SIZE:
+                return [f"File too large to diff: {change.path}"]
+            try:
+                data = self.read(save_id, change.path)
+            except (OSError, KeyError) as e:
+                return [f"Could not read {change.path}: {e}"]
+            if b'\0' in data[:BINARY_SNIFF]:
+                return [f"Binary file {change.path} differs"]
+            sides.append(data)
+
+        old_lines, new_lines = (data.decode('utf-8', 'replace').splitlines() for data in sides)
+        return list(difflib.unified_diff(
+            old_lines, new_lines, lineterm='', n=context,
+            fromfile=f"{self.old_id}/{change.path}" if change.old_digest else '/dev/null',
+            tofile=f"{self.new_id or 'worktree'}/{change.path}" if change.new_digest else '/dev/null'))
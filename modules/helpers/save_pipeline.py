@@ -0,0 +1,251 @@
+import os
+import queue
+import threading
+from collections import Counter
+from helpers.hashing import CHUNK_SIZE, new_hash, hash_file, stat_digest
+from helpers.transport import REFLINK, HARDLINK, COPY, CHUNKED
+from helpers.chunking import Chunker
+
+# Chunks in flight between the reader and the writer thread
+QUEUE_CHUNKS = 16
+
+class SavePipeline:
+    """Reads each file once: every chunk updates the hash and is handed to a
+    writer thread that streams it into the object store"""
+
+    def __init__(self, store, algorithm='blake2b', max_hash_size=None, allow_hardlink=False,
+                 chunk_threshold=None):
+        self.store = store
+        self.algorithm = algorithm
+        self.max_hash_size = max_hash_size
+        # Hard links alias the working file, only safe if every tool writes by rename
+        self.allow_hardlink = allow_hardlink
+        # Files this large are split into content-defined chunks, None disables it
+        self.chunk_threshold = chunk_threshold
+        self.buf = bytearray(CHUNK_SIZE)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.files_read = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.bytes_linked = 0
+        self.strategies = Counter()
+        # Size of the chunked files and of the chunks that were new to the store
+        self.chunked_bytes = 0
+        self.new_chunk_bytes = 0
+
+    def dedup_stats(self):
+        """Chunking totals for the last run, None if nothing was chunked"""
+        if not self.strategies[CHUNKED]:
+            return None
+        return {'bytes': self.chunked_bytes, 'written': self.new_chunk_bytes}
+
+    def run(self, jobs, files, progress=None):
+        """Ingest (rel_path, path, stat) jobs, adding rel_path -> digest to files.
+        progress is called with (done, total) after each job."""
+        self.reset_stats()
+        if not jobs:
+            return files
+        chunks = queue.Queue(QUEUE_CHUNKS)
+        errors = []
+        writer = threading.Thread(target=self.write_objects, args=(chunks, errors),
+                                  name='sftm-save-writer', daemon=True)
+        writer.start()
+        try:
+            for done, (rel_path, path, st) in enumerate(jobs, 1):
+                digest = self.read_file(rel_path, path, st, chunks)
+                if digest is not None:
+                    files[rel_path] = digest
+                if progress is not None:
+                    progress(done, len(jobs))
+        finally:
+            chunks.put(('stop',))
+            writer.join()
+            self.store.flush()
+        if errors:
+            raise errors[0]
+        return files
+
+    def read_file(self, rel_path, path, st, chunks):
+        # Files above the hash cap are named by their path, size and mtime
+        stat_key = None
+        if self.max_hash_size is not None and st.st_size > self.max_hash_size:
+            stat_key = stat_digest(st, rel_path)
+            if self.store.has_object(stat_key):
+                # This very file, unchanged since it was stored
+                return stat_key
+        stat_only = stat_key is not None
+        if stat_only or st.st_size >= CHUNK_SIZE:
+            # Large files are cloned first when the filesystem allows it, and
+            # the hash is taken from the clone
+            try:
+                digest = self.link_file(path, st, stat_key)
+            except OSError:
+                return None
+            if digest is not None:
+                return digest
+        if self.chunk_threshold is not None and st.st_size >= self.chunk_threshold:
+            return self.chunk_file(path, st, stat_key, chunks)
+
+        h = None if stat_only else new_hash(self.algorithm)
+        try:
+            f = open(path, 'rb', buffering=0)
+        except OSError:
+            return None
+
+        if not stat_only and st.st_size < CHUNK_SIZE:
+            # Small files travel as a single message, and only when their
+            # content is not stored yet
+            try:
+                with f:
+                    data = f.read()
+            except OSError:
+                return None
+            h.update(data)
+            self.files_read += 1
+            self.bytes_read += len(data)
+            digest = h.hexdigest()
+            if not self.store.has_object(digest):
+                self.strategies[COPY] += 1
+                chunks.put(('file', data, digest, st))
+            return digest
+
+        chunks.put(('open',))
+        try:
+            with f:
+                while True:
+                    data = f.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    if h is not None:
+                        h.update(data)
+                    self.bytes_read += len(data)
+                    chunks.put(('data', data))
+        except OSError:
+            chunks.put(('abort',))
+            return None
+        self.files_read += 1
+        self.strategies[COPY] += 1
+        digest = stat_key if stat_only else h.hexdigest()
+        chunks.put(('close', digest, st))
+        return digest
+
+    def chunk_file(self, path, st, stat_key, chunks):
+        """Store path as content-defined chunks. The writer thread hashes each
+        chunk and only writes those the store lacks."""
+        h = None if stat_key is not None else new_hash(self.algorithm)
+        chunker = Chunker()
+        try:
+            with open(path, 'rb', buffering=0) as f:
+                while True:
+                    data = f.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    if h is not None:
+                        h.update(data)
+                    self.bytes_read += len(data)
+                    for chunk in chunker.feed(data):
+                        chunks.put(('chunk', chunk))
+        except OSError:
+            chunks.put(('abort',))
+            return None
+        for chunk in chunker.finish():
+            chunks.put(('chunk', chunk))
+        self.files_read += 1
+        self.strategies[CHUNKED] += 1
+        self.chunked_bytes += st.st_size
+        digest = stat_key if stat_key is not None else h.hexdigest()
+        chunks.put(('recipe', digest, st))
+        return digest
+
+    def link_file(self, path, st, stat_key):
+        """Store path by reflink or hard link, None if neither is available"""
+        transport = self.store.transport
+        tmp = self.store.temp_path()
+        if transport.reflink(path, tmp):
+            strategy = REFLINK
+        elif self.allow_hardlink and transport.hardlink(path, tmp):
+            strategy = HARDLINK
+        else:
+            return None
+        try:
+            if stat_key is not None:
+                digest = stat_key
+            else:
+                digest = hash_file(tmp, self.algorithm, self.buf)
+                self.files_read += 1
+                self.bytes_read += st.st_size
+            if strategy == REFLINK:
+                os.chmod(tmp, st.st_mode & 0o7777)
+                os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        except OSError:
+            os.remove(tmp)
+            raise
+        self.bytes_linked += self.store.commit_temp(tmp, digest)
+        self.strategies[strategy] += 1
+        return digest
+
+    def write_objects(self, chunks, errors):
+        out = tmp = None
+        recipe = []
+        while True:
+            item = chunks.get()
+            kind = item[0]
+            if kind == 'stop':
+                break
+            if errors:
+                # Keep draining so the reader never blocks on a full queue
+                continue
+            try:
+                if kind == 'file':
+                    _, data, digest, st = item
+                    self.bytes_written += self.store.put_data(data, digest, st)
+                elif kind == 'chunk':
+                    recipe.append(self.write_chunk(item[1]))
+                elif kind == 'recipe':
+                    _, digest, st = item
+                    if not self.store.has_object(digest):
+                        self.store.chunks.add(digest, recipe, st)
+                    recipe = []
+                elif kind == 'open':
+                    tmp = self.store.temp_path()
+                    out = open(tmp, 'wb')
+                elif kind == 'data':
+                    out.write(item[1])
+                elif kind == 'abort':
+                    if out is not None:
+                        out.close()
+                        os.remove(tmp)
+                    out = tmp = None
+                    recipe = []
+                elif kind == 'close':
+                    _, digest, st = item
+                    out.close()
+                    self.commit(tmp, digest, st)
+                    out = tmp = None
+            except Exception as e:
+                errors.append(e)
+                if out is not None:
+                    out.close()
+                if tmp is not None and os.path.exists(tmp):
+                    os.remove(tmp)
+                out = tmp = None
+                recipe = []
+
+    def write_chunk(self, data):
+        # Hashing here overlaps with the reader hashing the whole file,
+        # hashlib releases the GIL on large buffers
+        h = new_hash(self.algorithm)
+        h.update(data)
+        digest = h.hexdigest()
+        if not self.store.has_object(digest):
+            self.bytes_written += self.store.put_data(data, digest, None)
+            self.new_chunk_bytes += len(data)
+        return [digest, len(data)]
+
+    def commit(self, tmp, digest, st):
+        # Objects keep the mode and mtime of the file they were saved from
+        os.chmod(tmp, st.st_mode & 0o7777)
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.bytes_written += self.store.commit_temp(tmp, digest)
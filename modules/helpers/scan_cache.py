@@ -0,0 +1,106 @@
+import os
+import json
+import time
+
+# Files modified this close to the start of a pass are hashed again next time,
+# a write landing in the same mtime tick would otherwise go unnoticed.
+RACY_WINDOW_NS = 2_000_000_000
+# Bumped when the layout of the persisted index or its digests changes
+INDEX_VERSION = 2
+
+class ScanCache:
+    """Remembers file hashes by stat data so unchanged files are never reopened"""
+
+    def __init__(self, paranoid_interval=0):
+        # Seconds between forced full rehashes, 0 disables them
+        self.paranoid_interval = paranoid_interval
+        self.entries = {}
+        self.last_full_pass = time.monotonic()
+        self.pass_started_ns = 0
+        self.full_pass = False
+        # Passes begun so far, to tell whether the counters below are new
+        self.passes = 0
+        self.stat_skipped = 0
+        self.rehashed = 0
+        # Whether entries changed since the index was loaded or saved
+        self.dirty = False
+
+    @staticmethod
+    def stat_key(st):
+        return (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+    def begin_pass(self, full_allowed=True):
+        """Start counting a pass. Only a pass over every file may take a due
+        paranoid rehash, partial ones leave it to the next walk."""
+        self.passes += 1
+        self.stat_skipped = 0
+        self.rehashed = 0
+        self.pass_started_ns = time.time_ns()
+        self.full_pass = full_allowed and self.full_pass_due()
+        if self.full_pass:
+            self.last_full_pass = time.monotonic()
+
+    def full_pass_due(self):
+        return bool(self.paranoid_interval) and \
+            time.monotonic() - self.last_full_pass >= self.paranoid_interval
+
+    def lookup(self, path, st):
+        """Cached digest for path if its stat data is unchanged, else None"""
+        if self.full_pass:
+            return None
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == self.stat_key(st):
+            self.stat_skipped += 1
+            return entry[1]
+        return None
+
+    def store(self, path, st, digest):
+        self.rehashed += 1
+        if st.st_mtime_ns >= self.pass_started_ns - RACY_WINDOW_NS:
+            if self.entries.pop(path, None) is not None:
+                self.dirty = True
+            return
+        entry = (self.stat_key(st), digest)
+        if self.entries.get(path) != entry:
+            self.entries[path] = entry
+            self.dirty = True
+
+    def end_pass(self, seen):
+        """Forget files that were not seen during the pass"""
+        for path in [p for p in self.entries if p not in seen]:
+            del self.entries[path]
+            self.dirty = True
+
+    def load(self, path, algorithm, max_hash_size):
+        """Read entries saved by a previous run, so startup only rehashes files
+        whose stat data changed since. A missing or unreadable index, or one
+        written with other hash settings, is ignored."""
+        try:
+            with open(path) as f:
+                index = json.load(f)
+            if index.get('version') != INDEX_VERSION or index.get('algorithm') != algorithm or \
+                    index.get('max_hash_size') != max_hash_size:
+                return False
+            self.entries = {rel_path: (tuple(key), digest)
+                            for rel_path, (key, digest) in index['entries'].items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring unreadable scan index {path}: {e}")
+            return False
+        self.dirty = False
+        return True
+
+    def save(self, path, algorithm, max_hash_size):
+        """Write the entries for the next run if they changed"""
+        if not self.dirty:
+            return
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'algorithm': algorithm,
+                       'max_hash_size': max_hash_size, 'entries': self.entries}, f, separators=(',', ':'))
+        os.replace(tmp, path)
+        self.dirty = False
+
+    def stats(self):
+        return {'stat_skipped': self.stat_skipped, 'rehashed': self.rehashed,
+                'full_pass': self.full_pass}
@@ -0,0 +1,378 @@
+import os
+import json
+import shutil
+import itertools
+from collections import OrderedDict
+from helpers.transport import Transport
+from helpers.packs import PackStore
+from helpers.catalog import SaveCatalog
+from helpers.chunking import ChunkIndex
+from helpers.store_lock import StoreLock
+from helpers.file_state import FileState, as_file_state
+
+# Saves written before the object store existed have no 'format' key in
+# meta.json and keep a full copy of every file inside the save directory.
+LEGACY_FORMAT = 1
+STORE_FORMAT = 2
+
+# Incremental saves only record what changed since their parent, every
+# CHECKPOINT_INTERVAL saves a full manifest keeps the chain short
+CHECKPOINT_INTERVAL = 20
+CACHED_MANIFESTS = 32
+CACHED_STATES = 4
+# Manifests list the permission bits of files that differ from this
+DEFAULT_MODE = 0o644
+
+def diff_files(old, new):
+    """Paths added or modified in new (path -> digest) and paths gone from old"""
+    if isinstance(old, FileState) and isinstance(new, FileState):
+        return old.diff(new)
+    changed = {path: digest for path, digest in new.items() if old.get(path) != digest}
+    deleted = [path for path in old if path not in new]
+    return changed, deleted
+
+def is_delta(meta):
+    return 'files' not in meta
+
+def saved_mode(meta, file):
+    """Permission bits file was saved with, None for saves that did not
+    record them and restore the mode of the object"""
+    modes = meta.get('modes')
+    if modes is None:
+        return None
+    return modes.get(file, DEFAULT_MODE)
+
+def dump_manifest(meta, f):
+    # Cached manifests hold their files as a FileState
+    if 'files' in meta:
+        meta = dict(meta, files=dict(meta['files'].items()))
+    json.dump(meta, f)
+
+class SnapshotStore:
+    """Content-addressed object store: each save is a manifest of path -> hash"""
+
+    def __init__(self, saves_dir, pack_options=None):
+        self.saves_dir = saves_dir
+        self.objects_dir = os.path.join(saves_dir, 'objects')
+        self.tmp_dir = os.path.join(self.objects_dir, 'tmp')
+        self.tmp_names = itertools.count()
+        self.known_dirs = set()
+        self.transport = Transport()
+        self.checkpoint_interval = CHECKPOINT_INTERVAL
+        self.manifests = OrderedDict()
+        self.states = OrderedDict()
+        self.catalog = SaveCatalog(saves_dir)
+        # Small objects go to compressed packs unless pack_options is None
+        self.packs = PackStore(self.objects_dir, **pack_options) \
+            if pack_options is not None else None
+        # Large files saved as content-defined chunks
+        self.chunks = ChunkIndex(self.objects_dir)
+        # Held by whichever process is writing to saves_dir, see TrackerEngine
+        self.lock = StoreLock(saves_dir, self.reload, self.flush)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def has_object(self, digest):
+        if self.packs is not None and digest in self.packs or digest in self.chunks:
+            return True
+        return os.path.exists(self.object_path(digest))
+
+    def read_object(self, digest):
+        """Content of a packed or loose object"""
+        if self.packs is not None and digest in self.packs:
+            return self.packs.read(digest)
+        with open(self.object_path(digest), 'rb') as f:
+            return f.read()
+
+    def object_size(self, digest):
+        """Size of the content stored under digest, None if it is not stored"""
+        if self.packs is not None and digest in self.packs:
+            return self.packs.index[digest][3]
+        if digest in self.chunks:
+            return self.chunks.recipes[digest][0]
+        try:
+            return os.path.getsize(self.object_path(digest))
+        except OSError:
+            return None
+
+    def put_data(self, data, digest, st):
+        """Store an object held in memory, returns bytes added to disk.
+        st is None for chunks, which have no mode or mtime of their own."""
+        if self.packs is not None and self.packs.accepts(len(data)):
+            return self.packs.add(digest, data, st)
+        tmp = self.temp_path()
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        # Objects keep the mode and mtime of the file they were saved from
+        if st is not None:
+            os.chmod(tmp, st.st_mode & 0o7777)
+            os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        return self.commit_temp(tmp, digest)
+
+    def flush(self):
+        if self.packs is not None:
+            self.packs.flush()
+        self.chunks.flush()
+
+    def reload(self):
+        """Pick up what other processes wrote since this store last held the lock"""
+        if self.packs is not None:
+            self.packs.reload()
+        self.chunks.reload()
+        # Every save written, rewritten or deleted leaves a catalogue line
+        if self.catalog.reload(self):
+            self.manifests.clear()
+            self.states.clear()
+
+    def close(self):
+        if self.packs is not None:
+            self.packs.close()
+        self.chunks.close()
+
+    def ensure_dir(self, path):
+        if path not in self.known_dirs:
+            os.makedirs(path, exist_ok=True)
+            self.known_dirs.add(path)
+
+    def temp_path(self):
+        self.ensure_dir(self.tmp_dir)
+        return os.path.join(self.tmp_dir, f"{os.getpid()}-{next(self.tmp_names)}")
+
+    def commit_temp(self, tmp, digest):
+        """Move a fully written temp file to its object path, returns bytes added"""
+        dst = self.object_path(digest)
+        if os.path.exists(dst):
+            os.remove(tmp)
+            return 0
+        self.ensure_dir(os.path.dirname(dst))
+        size = os.path.getsize(tmp)
+        os.replace(tmp, dst)
+        return size
+
+    def new_save_id(self, timestamp):
+        """Save directory name for timestamp, suffixed if a save already has it"""
+        save_id, n = timestamp, 1
+        while os.path.exists(os.path.join(self.saves_dir, save_id)):
+            save_id = f"{timestamp}_{n}"
+            n += 1
+        return save_id
+
+    def write_manifest(self, timestamp, comment, files, algorithm='md5',
+                       parent=None, changes=None, transport=None, bytes_added=0,
+                       dedup=None, modes=None):
+        """Write a save of files, as a delta against parent when possible.
+
+        changes is the (changed, deleted) diff from the parent's files if the
+        caller already has it, transport counts how many objects each copy
+        strategy stored and dedup holds the chunking totals. modes maps the
+        files whose permission bits are not DEFAULT_MODE to theirs, objects
+        are shared between files so they cannot keep them. Returns the new
+        save id."""
+        self.catalog.ensure_loaded(self)
+        save_id = self.new_save_id(timestamp)
+        meta = {
+            'format': STORE_FORMAT,
+            'comment': comment,
+            'timestamp': save_id,
+            'algorithm': algorithm,
+            'parent': parent,
+            'depth': 0,
+            'transport': dict(transport or {}),
+            'file_count': len(files),
+            'bytes': bytes_added
+        }
+        if dedup is not None:
+            meta['dedup'] = dedup
+        if modes is not None:
+            meta['modes'] = dict(modes)
+        # The parent may have been pruned by another process since it was cached
+        parent_meta = self.try_read_manifest(parent) \
+            if parent and os.path.exists(os.path.join(self.saves_dir, parent)) else None
+        if parent_meta is not None and \
+                parent_meta.get('format', LEGACY_FORMAT) >= STORE_FORMAT and \
+                parent_meta.get('algorithm') == algorithm and \
+                parent_meta.get('depth', 0) + 1 < self.checkpoint_interval:
+            if changes is None:
+                changes = diff_files(self.load_files(parent), files)
+            meta['depth'] = parent_meta.get('depth', 0) + 1
+            meta['changed'], meta['deleted'] = changes[0], list(changes[1])
+        else:
+            meta['files'] = as_file_state(files)
+
+        save_path = os.path.join(self.saves_dir, save_id)
+        os.makedirs(save_path)
+        with open(os.path.join(save_path, 'meta.json'), 'w') as f:
+            dump_manifest(meta, f)
+        self.remember(self.manifests, save_id, meta, CACHED_MANIFESTS)
+        self.remember(self.states, save_id, as_file_state(files), CACHED_STATES)
+        self.catalog.add({
+            'id': save_id,
+            'timestamp': save_id,
+            'comment': comment,
+            'files': len(files),
+            'bytes': bytes_added,
+            'parent': parent,
+            'dedup': dedup,
+        })
+        return save_id
+
+    def import_manifest(self, save_id, meta):
+        """Write a manifest brought in from another store under save_id, or
+        a suffixed id if that one is taken. Returns the id used."""
+        self.catalog.ensure_loaded(self)
+        save_id = self.new_save_id(save_id)
+        meta = dict(meta, timestamp=save_id)
+        if 'files' in meta:
+            meta['files'] = as_file_state(meta['files'])
+        save_path = os.path.join(self.saves_dir, save_id)
+        os.makedirs(save_path)
+        path = os.path.join(save_path, 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            dump_manifest(meta, f)
+        os.replace(path + '.tmp', path)
+        self.remember(self.manifests, save_id, meta, CACHED_MANIFESTS)
+        self.catalog.add(self.catalog.entry_from_manifest(self, save_id))
+        return save_id
+
+    @staticmethod
+    def remember(cache, key, value, limit):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def read_manifest(self, save_id):
+        meta = self.manifests.get(save_id)
+        if meta is None:
+            with open(os.path.join(self.saves_dir, save_id, 'meta.json')) as f:
+                meta = json.load(f)
+            if 'files' in meta:
+                meta['files'] = FileState(meta['files'])
+            self.remember(self.manifests, save_id, meta, CACHED_MANIFESTS)
+        return meta
+
+    def try_read_manifest(self, save_id):
+        try:
+            return self.read_manifest(save_id)
+        except (OSError, ValueError):
+            return None
+
+    def load_files(self, save_id):
+        """Full path -> digest FileState of a save, replaying deltas from the
+        nearest full manifest"""
+        chain = []
+        files = None
+        current = save_id
+        while True:
+            if current in self.states:
+                files = self.states[current]
+                break
+            meta = self.read_manifest(current)
+            if not is_delta(meta):
+                files = meta['files']
+                break
+            chain.append(meta)
+            current = meta['parent']
+        for meta in reversed(chain):
+            files = files.updated(meta['changed'], meta['deleted'])
+        self.remember(self.states, save_id, files, CACHED_STATES)
+        return files
+
+    def forget(self, save_id):
+        self.manifests.pop(save_id, None)
+        self.states.pop(save_id, None)
+
+    def delete_save(self, save_id):
+        """Remove a save and its catalogue entry, objects are left to the collector"""
+        self.catalog.ensure_loaded(self)
+        self.catalog.remove(save_id)
+        shutil.rmtree(os.path.join(self.saves_dir, save_id), ignore_errors=True)
+        self.forget(save_id)
+
+    def rewrite_full(self, save_id, parent):
+        """Store a delta save as a full manifest under a new parent, so it no
+        longer depends on the saves between them"""
+        files = self.load_files(save_id)
+        meta = dict(self.read_manifest(save_id))
+        meta.pop('changed', None)
+        meta.pop('deleted', None)
+        meta.update(files=files, parent=parent, depth=0)
+        path = os.path.join(self.saves_dir, save_id, 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            dump_manifest(meta, f)
+        os.replace(path + '.tmp', path)
+        self.remember(self.manifests, save_id, meta, CACHED_MANIFESTS)
+        entry = self.catalog.get(save_id)
+        if entry is not None:
+            self.catalog.add(dict(entry, parent=parent))
+
+    def list_saves(self):
+        """Save ids, oldest first, from the catalogue"""
+        self.catalog.ensure_loaded(self)
+        return self.catalog.ids()
+
+    def page_saves(self, offset=0, limit=100):
+        """Catalogue entries, newest first"""
+        self.catalog.ensure_loaded(self)
+        return self.catalog.page(offset, limit)
+
+    def source_path(self, save_id, meta, files, file):
+        """Where the saved content of file lives for this save"""
+        if meta.get('format', LEGACY_FORMAT) == LEGACY_FORMAT:
+            return os.path.join(self.saves_dir, save_id, file)
+        return self.object_path(files[file])
+
+    def saved_size(self, save_id, file):
+        """Size of file as saved in save_id, None if its content is missing"""
+        meta = self.read_manifest(save_id)
+        files = self.load_files(save_id)
+        if meta.get('format', LEGACY_FORMAT) == LEGACY_FORMAT:
+            try:
+                return os.path.getsize(self.source_path(save_id, meta, files, file))
+            except OSError:
+                return None
+        return self.object_size(files[file])
+
+    def read_saved(self, save_id, file):
+        """Content of file as saved in save_id"""
+        meta = self.read_manifest(save_id)
+        files = self.load_files(save_id)
+        if meta.get('format', LEGACY_FORMAT) == LEGACY_FORMAT:
+            with open(self.source_path(save_id, meta, files, file), 'rb') as f:
+                return f.read()
+        digest = files[file]
+        if digest in self.chunks:
+            return b''.join(self.read_object(chunk) for chunk in self.chunks.chunk_digests(digest))
+        return self.read_object(digest)
+
+    def restore_file(self, save_id, meta, files, file, dst):
+        """Atomically replace dst with the saved content of file.
+
+        The content is written next to dst and renamed over it, so readers
+        never see a half-written file and a hard-linked dst never has an
+        object written through it."""
+        stored = meta.get('format', LEGACY_FORMAT) >= STORE_FORMAT
+        packed = stored and self.packs is not None and files[file] in self.packs
+        chunked = stored and not packed and files[file] in self.chunks
+        src = None if packed or chunked else self.source_path(save_id, meta, files, file)
+        if src is not None and not os.path.exists(src):
+            return False
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.sftm-restore")
+        try:
+            if packed:
+                self.packs.restore(files[file], tmp)
+            elif chunked:
+                self.chunks.restore(files[file], tmp, self.read_object)
+            else:
+                self.transport.clone(src, tmp)
+            mode = saved_mode(meta, file)
+            if mode is not None:
+                os.chmod(tmp, mode)
+            os.replace(tmp, dst)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return True
@@ -0,0 +1,209 @@
+import os
+import time
+from collections import Counter
+from helpers.snapshot_store import LEGACY_FORMAT, is_delta
+
+# Loose object directories are named after the first two digest characters
+OBJECT_DIR_LENGTH = 2
+# Temp files of other processes younger than this may still be in use
+STALE_TEMP_AGE = 3600
+
+class StoreCollector:
+    """Applies a retention policy and garbage-collects the snapshot store a
+    little at a time.
+
+    step() does at most a time slice of work and returns whether more is
+    left, so the caller can interleave it with scans and saves. Objects
+    written while a collection runs are passed to protect() and survive it.
+    A pass holds the store lock from its first step to its last, so other
+    processes sharing the store wait instead of writing saves it never marked."""
+
+    def __init__(self, store, policy):
+        self.store = store
+        self.policy = policy
+        self.work = None
+        self.live = set()
+        self.dropped = []
+        self.reclaimed = 0
+        self.usage = None
+        self.enforced = False
+        # Save id -> bytes only reachable from it and older saves, from the last pass
+        self.reclaimable = Counter()
+        self.newest_ref = {}
+        self.sizes = {}
+
+    @property
+    def active(self):
+        return self.work is not None
+
+    def needs_another_pass(self):
+        """Whether the store is still over budget after a pass that could
+        shrink it further"""
+        return self.policy.max_bytes is not None and self.usage is not None and \
+            self.usage > self.policy.max_bytes and (self.dropped or not self.enforced)
+
+    def start(self, protected=()):
+        """Begin a collection unless one is running"""
+        if self.work is None:
+            self.work = self.run(set(protected))
+
+    def cancel(self):
+        if self.work is not None:
+            # Runs the pass's finally blocks, releasing the lock
+            self.work.close()
+        self.work = None
+
+    def step(self, time_slice=0.02):
+        if self.work is None:
+            return False
+        deadline = time.monotonic() + time_slice
+        try:
+            while time.monotonic() < deadline:
+                next(self.work)
+        except StopIteration:
+            self.work = None
+        return self.work is not None
+
+    def protect(self, save_id, files):
+        """Keep the objects of a save written during the collection"""
+        if self.work is None:
+            return
+        for digest in files.values():
+            self.mark(digest, save_id)
+
+    def mark(self, digest, save_id):
+        """Mark digest live, and save_id as the newest save using it so far"""
+        self.live.add(digest)
+        self.newest_ref[digest] = save_id
+        if digest in self.store.chunks:
+            for chunk in self.store.chunks.chunk_digests(digest):
+                self.live.add(chunk)
+                self.newest_ref[chunk] = save_id
+
+    def run(self, protected):
+        with self.store.lock:
+            yield from self.collect(protected)
+
+    def collect(self, protected):
+        store = self.store
+        # Saves, packs and recipes other processes added before this pass
+        store.reload()
+        store.catalog.ensure_loaded(store)
+        entries = store.catalog.page(0, len(store.catalog), newest_first=False)
+        drop = self.policy.expired(entries, protected=protected)
+        # The budget needs the size measured at the end of the previous pass
+        self.enforced = self.usage is not None
+        if self.enforced:
+            kept = [entry for entry in entries if entry['id'] not in drop]
+            drop += self.policy.over_budget(kept, self.usage, protected, self.reclaimable)
+        self.dropped = drop
+        self.reclaimed = 0
+        self.live = set()
+        self.newest_ref = {}
+        self.sizes = {}
+        yield from self.drop_saves(set(drop))
+
+        # Mark everything the remaining saves reference, oldest first so each
+        # delta replays onto the state loaded just before it
+        for save_id in store.list_saves():
+            meta = store.try_read_manifest(save_id)
+            if meta is None or meta.get('format', LEGACY_FORMAT) == LEGACY_FORMAT:
+                continue
+            for digest in store.load_files(save_id).values():
+                self.mark(digest, save_id)
+            yield
+
+        yield from self.sweep_loose()
+        store.chunks.rewrite(self.live)
+        yield
+        if store.packs is not None:
+            self.reclaimed += yield from store.packs.repack(self.live)
+        yield from self.sweep_temp()
+        yield from self.measure()
+        self.count_reclaimable()
+
+    def drop_saves(self, drop):
+        """Delete saves, first rewriting kept deltas whose chain runs through them"""
+        store = self.store
+        ids = store.list_saves()
+        for save_id in ids:
+            if save_id in drop:
+                continue
+            meta = store.try_read_manifest(save_id)
+            if meta is None or not is_delta(meta) or meta.get('parent') not in drop:
+                continue
+            parent = meta['parent']
+            while parent in drop:
+                parent = store.read_manifest(parent).get('parent')
+            store.rewrite_full(save_id, parent)
+            yield
+        for save_id in ids:
+            if save_id in drop:
+                store.delete_save(save_id)
+                yield
+
+    def sweep_loose(self):
+        objects_dir = self.store.objects_dir
+        try:
+            dirs = [entry.name for entry in os.scandir(objects_dir)
+                    if entry.is_dir() and len(entry.name) == OBJECT_DIR_LENGTH]
+        except FileNotFoundError:
+            return
+        for name in dirs:
+            path = os.path.join(objects_dir, name)
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    digest = name + entry.name
+                    try:
+                        size = entry.stat().st_size
+                        if digest in self.live:
+                            self.sizes[digest] = size
+                        else:
+                            os.remove(entry.path)
+                            self.reclaimed += size
+                    except OSError:
+                        continue
+            yield
+
+    def sweep_temp(self):
+        """Remove temp objects left behind by crashed saves"""
+        tmp_dir = self.store.tmp_dir
+        own = f"{os.getpid()}-"
+        now = time.time()
+        try:
+            entries = list(os.scandir(tmp_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if not entry.name.startswith(own) and \
+                        now - entry.stat().st_mtime > STALE_TEMP_AGE:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+        yield
+
+    def count_reclaimable(self):
+        """Bytes freed by dropping each save along with every older one, for
+        the disk budget of the next pass"""
+        packs = self.store.packs.index if self.store.packs is not None else {}
+        self.reclaimable = Counter()
+        for digest, save_id in self.newest_ref.items():
+            size = self.sizes.get(digest)
+            if size is None and digest in packs:
+                size = packs[digest][2]
+            self.reclaimable[save_id] += size or 0
+
+    def measure(self):
+        """Total size of .saves, used to enforce the disk budget next time"""
+        usage = 0
+        stack = [self.store.saves_dir]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        usage += entry.stat(follow_symlinks=False).st_size
+            yield
+        self.usage = usage
@@ -0,0 +1,114 @@
+import os
+import json
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOCK_NAME = 'lock'
+
+class StoreLock:
+    """Exclusive lock on a .saves directory, held by one process at a time.
+
+    Re-entrant, only the outermost acquire takes the flock. It then calls
+    on_acquire so the store picks up what other processes wrote, and the
+    outermost release calls on_release first so everything this process
+    wrote is on disk before the next one looks. Two stores in one process
+    lock each other out like two processes do. Without fcntl (Windows)
+    it only runs the callbacks."""
+
+    def __init__(self, saves_dir, on_acquire=None, on_release=None):
+        self.path = os.path.join(saves_dir, LOCK_NAME)
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.depth = 0
+        self.file = None
+
+    @property
+    def held(self):
+        return self.depth > 0
+
+    def acquire(self):
+        if self.depth == 0:
+            if fcntl is not None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.file = open(self.path, 'a')
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            try:
+                if self.on_acquire is not None:
+                    self.on_acquire()
+            except BaseException:
+                self.unlock()
+                raise
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            try:
+                if self.on_release is not None:
+                    self.on_release()
+            finally:
+                self.unlock()
+
+    def unlock(self):
+        if self.file is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class LogTail:
+    """How far an append-only JSON lines file has been read, so lines other
+    processes appended can be picked up without reading it all again"""
+
+    def __init__(self, path):
+        self.path = path
+        self.inode = None
+        self.offset = 0
+
+    def read(self):
+        """(whether the file was replaced or truncated since the last read,
+        entries appended since). After a replace the entries are the whole file."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            reset = self.offset > 0
+            self.inode = None
+            self.offset = 0
+            return reset, []
+        with f:
+            st = os.fstat(f.fileno())
+            reset = self.inode is not None and st.st_ino != self.inode or st.st_size < self.offset
+            if reset:
+                self.offset = 0
+            self.inode = st.st_ino
+            f.seek(self.offset)
+            entries = []
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # still being written, or torn by a crash
+                self.offset += len(line)
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return reset, entries
+
+    def appended(self, start, end):
+        """This process wrote the bytes from start to end itself, skip them
+        if everything before them was read already"""
+        if start == self.offset:
+            self.offset = end
+
+    def rewritten(self):
+        """This process replaced the file with what it already holds"""
+        st = os.stat(self.path)
+        self.inode = st.st_ino
+        self.offset = st.st_size
@@ -1,82 +1,817 @@
 import os
+import re
 import ast
 import sys
+import json
+import time
+import heapq
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from PyQt6.QtWidgets import (QApplication, QMainWindow, QTreeWidget, QTreeWidgetItem, 
-                            QVBoxLayout, QWidget, QSplitter, QTextEdit, QStyle)
-from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QTreeView, QLineEdit, QListWidget,
+                            QListWidgetItem, QVBoxLayout, QWidget, QSplitter, QTextEdit, QStyle)
+from PyQt6.QtCore import Qt, QTimer, QAbstractItemModel, QModelIndex, pyqtSignal
 from PyQt6.QtGui import QIcon, QFont, QColor
 
+# The outline cache lives in the scanned directory's .saves, next to the
+# data SFTM keeps there and never snapshots
+CACHE_NAME = os.path.join('.saves', 'outline_cache')
+CACHE_VERSION = 2
+MAX_CACHED_FILES = 10000
+# Files modified this close to being read are hashed on every lookup, an
+# edit in the same mtime tick would otherwise keep its stat data
+RACY_WINDOW_NS = 2_000_000_000
+# Files sent to a worker process per task: the first tasks are small so
+# results show up at once, later ones grow to cut per-task overhead
+MAX_BATCH = 32
+
+# Expanded rows are remembered by path, symbols as path::Class/method
+SYMBOL_SEPARATOR = '::'
+
+# Symbols the search box finds
+INDEXED_TYPES = ('ClassDef', 'FunctionDef', 'AsyncFunctionDef')
+# Matches ranked per query at most, for queries that hit a large part of the project
+MAX_CANDIDATES = 3000
+SEARCH_RESULTS = 100
+# A search after this long rescans the project for changed files
+RESCAN_INTERVAL = 10
+NONZERO_BYTE = re.compile(rb'[^\x00]')
+
+TYPE_LABELS = {'Root': "Root", 'Directory': "Directory", 'File': "File", 'Section': "Section",
+               'ClassDef': "Class", 'Import': "Import", 'ImportFrom': "Import", 'Error': "Error"}
+ICONS = {'Root': QStyle.StandardPixmap.SP_DirIcon,
+         'Directory': QStyle.StandardPixmap.SP_DirIcon,
+         'Section': QStyle.StandardPixmap.SP_DirIcon,
+         'ClassDef': QStyle.StandardPixmap.SP_DirIcon,
+         'File': QStyle.StandardPixmap.SP_FileIcon,
+         'FunctionDef': QStyle.StandardPixmap.SP_FileIcon,
+         'AsyncFunctionDef': QStyle.StandardPixmap.SP_FileIcon,
+         'Import': QStyle.StandardPixmap.SP_ArrowRight,
+         'ImportFrom': QStyle.StandardPixmap.SP_ArrowRight,
+         'Assign': QStyle.StandardPixmap.SP_FileDialogDetailedView}
+
+# Statement lists of compound statements, where definitions can hide
+# (if TYPE_CHECKING:, try/except imports, match arms)
+BODY_FIELDS = ('body', 'orelse', 'handlers', 'finalbody', 'cases')
+
+class OutlineVisitor(ast.NodeVisitor):
+    """Builds the nested outline of a module in one pass over its statements.
+
+    Symbols are dicts with type (the ast class name), name, lineno,
+    end_lineno, args and children. Expressions are never entered, and
+    assignments are only kept at module and class level."""
+
+    def __init__(self):
+        self.symbols = []
+        self.scopes = [('Module', self.symbols)]
+
+    def add(self, node, kind, name, args=()):
+        symbol = {'type': kind, 'name': name, 'lineno': node.lineno,
+                  'end_lineno': node.end_lineno, 'args': list(args), 'children': []}
+        self.scopes[-1][1].append(symbol)
+        return symbol
+
+    def visit_scope(self, node, symbol):
+        self.scopes.append((symbol['type'], symbol['children']))
+        self.generic_visit(node)
+        self.scopes.pop()
+
+    def generic_visit(self, node):
+        for field in BODY_FIELDS:
+            for child in getattr(node, field, ()):
+                self.visit(child)
+
+    def visit_ClassDef(self, node):
+        self.visit_scope(node, self.add(node, 'ClassDef', node.name))
+
+    def visit_FunctionDef(self, node):
+        args = node.args
+        names = [arg.arg for arg in args.posonlyargs + args.args]
+        if args.vararg:
+            names.append(f"*{args.vararg.arg}")
+        elif args.kwonlyargs:
+            names.append('*')
+        names += [arg.arg for arg in args.kwonlyargs]
+        if args.kwarg:
+            names.append(f"**{args.kwarg.arg}")
+        self.visit_scope(node, self.add(node, type(node).__name__, node.name, names))
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Import(self, node):
+        self.add(node, 'Import', f"import {', '.join(n.name for n in node.names)}")
+
+    def visit_ImportFrom(self, node):
+        module = '.' * node.level + (node.module or '')
+        self.add(node, 'ImportFrom', f"from {module} import {', '.join(n.name for n in node.names)}")
+
+    def visit_Assign(self, node):
+        if self.scopes[-1][0] not in ('Module', 'ClassDef'):
+            return
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        for target in targets:
+            for name in (target.elts if isinstance(target, (ast.Tuple, ast.List)) else [target]):
+                if isinstance(name, ast.Name):
+                    self.add(node, 'Assign', name.id)
+
+    visit_AnnAssign = visit_Assign
+
+class OutlineCache:
+    """Symbol trees from earlier runs, by path, size and mtime.
+
+    A file whose stat data changed is hashed and keeps its tree if the
+    content is the same. Trees are kept as JSON text and only decoded when
+    their file is expanded. Entries are kept in least recently used order
+    and the oldest dropped beyond max_entries, files that no longer exist
+    are forgotten. Also remembers which rows of the viewer were expanded."""
+
+    def __init__(self, path, max_entries=MAX_CACHED_FILES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # file -> [size, mtime_ns, content hash, symbols JSON]
+        self.expanded = set()
+        self.dirty = False
+        self.hits = 0
+        self.rehashed = 0
+        self.parsed = 0
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                cache = json.load(f)
+            if cache.get('version') != CACHE_VERSION:
+                return
+            self.entries = OrderedDict(cache['entries'])
+            self.expanded = set(cache.get('expanded', ()))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring unreadable outline cache {self.path}: {e}")
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'entries': self.entries,
+                           'expanded': sorted(self.expanded)}, f, separators=(',', ':'))
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except OSError as e:
+            print(f"Error writing outline cache: {e}")
+
+    def lookup(self, file_path, st):
+        """Cached symbols JSON of file_path if its stat data is unchanged, else None"""
+        key = os.path.normpath(file_path)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+        return None
+
+    def digest(self, file_path):
+        """Content hash the cached symbols of file_path were parsed from"""
+        entry = self.entries.get(os.path.normpath(file_path))
+        return entry[2] if entry is not None else None
+
+    def store(self, file_path, size, mtime_ns, digest, symbols=None):
+        """Record the symbols JSON of file_path, None keeps the cached one
+        because the content hashed the same. Returns the symbols JSON, or
+        None if the cached one was evicted in the meantime."""
+        key = os.path.normpath(file_path)
+        if symbols is None:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.rehashed += 1
+            symbols = entry[3]
+        else:
+            self.parsed += 1
+        if mtime_ns >= time.time_ns() - RACY_WINDOW_NS:
+            mtime_ns = None
+        self.entries[key] = [size, mtime_ns, digest, symbols]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.dirty = True
+        return symbols
+
+    def set_expanded(self, key, expanded):
+        if expanded != (key in self.expanded):
+            if expanded:
+                self.expanded.add(key)
+            else:
+                self.expanded.discard(key)
+            self.dirty = True
+
+    def forget_missing(self):
+        """Drop entries and expanded rows of files that no longer exist"""
+        for key in [key for key in self.entries if not os.path.exists(key)]:
+            del self.entries[key]
+            self.dirty = True
+        for key in [key for key in self.expanded
+                    if not os.path.exists(key.partition(SYMBOL_SEPARATOR)[0])]:
+            self.expanded.discard(key)
+            self.dirty = True
+
 class FileAnalyzer:
     def analyze_python_file(self, file_path: Path) -> list:
-        """Returns a list of symbols/components in VS Code outline style"""
+        """Returns the nested symbols of a file in VS Code outline style"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-            
-            tree = ast.parse(content)
-            symbols = []
-            
-            for node in ast.walk(tree):
-                if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.ImportFrom, ast.Import)):
-                    symbol = {
-                        'type': type(node).__name__,
-                        'name': '',
-                        'lineno': node.lineno,
-                        'args': []
-                    }
-                    
-                    if isinstance(node, (ast.ClassDef, ast.FunctionDef)):
-                        symbol['name'] = node.name
-                        if isinstance(node, ast.FunctionDef):
-                            symbol['args'] = [arg.arg for arg in node.args.args]
-                    
-                    elif isinstance(node, ast.ImportFrom):
-                        symbol['name'] = f"from {node.module} import {', '.join(n.name for n in node.names)}"
-                    
-                    elif isinstance(node, ast.Import):
-                        symbol['name'] = f"import {', '.join(n.name for n in node.names)}"
-                    
-                    symbols.append(symbol)
-            
-            return sorted(symbols, key=lambda x: x['lineno'])
-            
+            with open(file_path, 'rb') as file:
+                return self.analyze_source(file.read())
+
         except Exception as e:
-            return [{'type': 'Error', 'name': str(e), 'lineno': 0}]
+            return error_symbols(e)
+
+    def analyze_source(self, content: bytes) -> list:
+        """Symbols of source code, a syntax error is a symbol too so it is cached"""
+        try:
+            visitor = OutlineVisitor()
+            visitor.visit(ast.parse(content))
+            return visitor.symbols
+        except (SyntaxError, ValueError) as e:
+            return error_symbols(e)
+
+    def outline_file(self, file_path: str, known_digest: str = None) -> tuple:
+        """(size, mtime_ns, digest, symbols JSON) of a file, the JSON is None
+        when its content still hashes to known_digest"""
+        st = os.stat(file_path)
+        with open(file_path, 'rb') as file:
+            content = file.read()
+        digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+        if digest == known_digest:
+            return st.st_size, st.st_mtime_ns, digest, None
+        return st.st_size, st.st_mtime_ns, digest, dump_symbols(self.analyze_source(content))
+
+def dump_symbols(symbols):
+    return json.dumps(symbols, separators=(',', ':'))
+
+def error_symbols(e):
+    return [{'type': 'Error', 'name': str(e), 'lineno': 0, 'children': []}]
+
+def analyze_batch(jobs):
+    """Outline (path, known digest) jobs in a worker process. Returns plain
+    (path, size, mtime_ns, digest, symbols JSON) tuples, size is None when
+    the file could not be read."""
+    analyzer = FileAnalyzer()
+    results = []
+    for file_path, known_digest in jobs:
+        try:
+            results.append((file_path, *analyzer.outline_file(file_path, known_digest)))
+        except Exception as e:
+            results.append((file_path, None, None, None, dump_symbols(error_symbols(e))))
+    return results
+
+def mask_ids(mask):
+    """Ids of the set bits of an int bitmap, lowest first"""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    for match in NONZERO_BYTE.finditer(data):
+        base = match.start() * 8
+        byte = data[match.start()]
+        while byte:
+            low = byte & -byte
+            yield base + low.bit_length() - 1
+            byte ^= low
+
+class SymbolIndex:
+    """Class, function and method names of a project, for fuzzy search.
+
+    Every character and trigram of a lowercased name has a bitmap of the
+    symbol ids holding it, so the candidates for a query are the AND of a
+    few ints: names containing the query come from its trigrams, short
+    queries from a sorted list of names, and abbreviations like 'gtusr'
+    match names holding its letters in order. Files are indexed and
+    dropped one at a time, freed ids are reused so bitmaps stay dense."""
 
-class ProjectViewer(QMainWindow):
     def __init__(self):
+        self.records = []  # id -> (name, lowercase name, type, path, lineno, key), None if free
+        self.free = []
+        self.files = {}  # path -> (content hash it was indexed from, ids)
+        self.bitmaps = {}  # character or trigram -> bytearray of id bits
+        self.initials = {}  # first character -> bytearray of id bits
+        self.names = []  # sorted (lowercase name, id)
+
+    def __len__(self):
+        return len(self.records) - len(self.free)
+
+    def digest(self, path):
+        entry = self.files.get(path)
+        return entry[0] if entry is not None else None
+
+    def update_file(self, path, digest, symbols):
+        """(Re)index the symbols of path, parsed from content hashing to digest"""
+        self.remove_file(path)
+        ids = []
+        self.add_symbols(path, symbols, path + SYMBOL_SEPARATOR, ids)
+        self.files[path] = (digest, ids)
+
+    def add_symbols(self, path, symbols, prefix, ids):
+        for symbol in symbols:
+            if symbol['type'] not in INDEXED_TYPES:
+                continue
+            name = symbol['name']
+            key = prefix + name
+            ids.append(self.add((name, name.lower(), symbol['type'], path, symbol['lineno'], key)))
+            self.add_symbols(path, symbol['children'], key + '/', ids)
+
+    def add(self, record):
+        symbol_id = self.free.pop() if self.free else len(self.records)
+        if symbol_id == len(self.records):
+            self.records.append(record)
+        else:
+            self.records[symbol_id] = record
+        lname = record[1]
+        for gram in grams(lname):
+            set_bit(self.bitmaps, gram, symbol_id)
+        set_bit(self.initials, lname[:1], symbol_id)
+        bisect.insort(self.names, (lname, symbol_id))
+        return symbol_id
+
+    def remove_file(self, path):
+        _, ids = self.files.pop(path, (None, ()))
+        for symbol_id in ids:
+            lname = self.records[symbol_id][1]
+            for gram in grams(lname):
+                clear_bit(self.bitmaps, gram, symbol_id)
+            clear_bit(self.initials, lname[:1], symbol_id)
+            del self.names[bisect.bisect_left(self.names, (lname, symbol_id))]
+            self.records[symbol_id] = None
+            self.free.append(symbol_id)
+
+    def mask(self, table, key):
+        bits = table.get(key)
+        return int.from_bytes(bits, 'little') if bits else 0
+
+    def search(self, query, limit=50):
+        """Best matches for query as dicts with name, type, path, lineno
+        and key: whole names, then prefixes, substrings at a word start,
+        other substrings and last letters in order, shorter names first"""
+        query = ''.join(query.lower().split())
+        if not query:
+            return []
+        records = self.records
+        # Prefixes are what type-ahead wants, they rank above anything else
+        scored = []
+        i = bisect.bisect_left(self.names, (query,))
+        while i < len(self.names) and len(scored) < MAX_CANDIDATES and \
+                self.names[i][0].startswith(query):
+            lname, symbol_id = self.names[i]
+            record = records[symbol_id]
+            scored.append((int(lname != query), len(lname), record[3], record[4], symbol_id))
+            i += 1
+        if len(scored) < limit:
+            prefixed = {hit[-1] for hit in scored}
+            found = 0
+            if len(query) >= 3:
+                found = -1
+                for gram in {query[i:i + 3] for i in range(len(query) - 2)}:
+                    found &= self.mask(self.bitmaps, gram)
+            candidates = list(itertools.islice(mask_ids(found), MAX_CANDIDATES))
+            if len(candidates) < limit:
+                # Few substrings, also try the query as an abbreviation,
+                # which is taken to start where the name does
+                letters = self.mask(self.initials, query[0]) if len(query) >= 3 else -1
+                for char in set(query):
+                    letters &= self.mask(self.bitmaps, char)
+                candidates += itertools.islice(mask_ids(letters & ~found), MAX_CANDIDATES)
+            pattern = re.compile('.*?'.join(map(re.escape, query)))
+            for symbol_id in candidates:
+                if symbol_id in prefixed:
+                    continue
+                record = records[symbol_id]
+                score = match_score(record[0], record[1], query, pattern)
+                if score is not None:
+                    scored.append((score, len(record[1]), record[3], record[4], symbol_id))
+        results = []
+        for hit in heapq.nsmallest(limit, scored):
+            name, _, kind, path, lineno, key = self.records[hit[-1]]
+            results.append({'name': name, 'type': kind, 'path': path, 'lineno': lineno, 'key': key})
+        return results
+
+def grams(lname):
+    """Characters and trigrams of a lowercase name"""
+    return set(lname).union(lname[i:i + 3] for i in range(len(lname) - 2))
+
+def set_bit(table, key, bit):
+    byte = bit >> 3
+    bits = table.get(key)
+    if bits is None:
+        bits = table[key] = bytearray(byte + 1)
+    elif len(bits) <= byte:
+        bits.extend(bytes(byte + 1 - len(bits)))
+    bits[byte] |= 1 << (bit & 7)
+
+def clear_bit(table, key, bit):
+    table[key][bit >> 3] &= ~(1 << (bit & 7)) & 0xff
+
+def match_score(name, lname, query, pattern):
+    """Rank of a name that does not start with a lowercase query, lower is
+    better (exact names rank 0, prefixes 1), None if it does not match"""
+    pos = lname.find(query)
+    if pos > 0:
+        boundary = name[pos - 1] in '_.' or (name[pos].isupper() and not name[pos - 1].isupper())
+        return 2 if boundary else 3
+    match = pattern.search(lname)
+    if match is None:
+        return None
+    # Tighter abbreviations first
+    return 4 + (match.end() - match.start() - len(query)) / len(lname)
+
+def contains_key(key, target):
+    """Whether the row keyed key is target or one of its ancestors"""
+    if key is None:
+        return False
+    return key == target or key == os.curdir or \
+        target.startswith((key + os.sep, key + '/', key + SYMBOL_SEPARATOR))
+
+class OutlineNode:
+    """One row of the outline. children stays None until the row is first
+    expanded: directories are listed and symbol dicts turned into rows then.
+    symbols is the JSON text of a file, or the raw symbol dicts below a row."""
+    __slots__ = ('parent', 'row', 'kind', 'label', 'key', 'in_class', 'symbols', 'children')
+
+    def __init__(self, parent, row, kind, label, key, symbols=None, in_class=False):
+        self.parent = parent
+        self.row = row
+        self.kind = kind
+        self.label = label
+        self.key = key
+        self.in_class = in_class
+        self.symbols = symbols
+        self.children = None
+
+    @property
+    def type_label(self):
+        if self.kind in ('FunctionDef', 'AsyncFunctionDef'):
+            label = "Method" if self.in_class else "Function"
+            return f"Async {label}" if self.kind == 'AsyncFunctionDef' else label
+        if self.kind == 'Assign':
+            return "Attribute" if self.in_class else "Variable"
+        return TYPE_LABELS.get(self.kind, self.kind)
+
+class OutlineModel(QAbstractItemModel):
+    """Lazy outline of a directory.
+
+    Directories are listed when expanded and their Python files sent to
+    worker processes, whose results stream back through the analyzed
+    signal. A file's rows are made from its symbols when it is expanded,
+    each symbol's when it is. The search index covers the whole project
+    once update_index has run, and follows every outline that arrives."""
+    # (jobs, finished future), emitted from the pool's callback thread
+    analyzed = pyqtSignal(object, object)
+    # The search index changed
+    indexed = pyqtSignal()
+
+    def __init__(self, root_path, style, parent=None):
+        super().__init__(parent)
+        self.style = style
+        self.icons = {}
+        self.cache = OutlineCache(os.path.join(root_path, CACHE_NAME))
+        self.cache.load()
+        self.pool = None
+        self.pending = 0
+        self.queued = set()  # paths sent to a worker
+        self.files = {}  # path -> file row waiting for a worker
+        self.waiting = set()  # file rows expanded before their outline arrived
+        self.symbol_index = SymbolIndex()
+        self.scan = None
+        self.scanned = None  # time.monotonic() of the last finished scan
+        self.root = OutlineNode(None, 0, 'Root', '', None)
+        self.root.children = [OutlineNode(self.root, 0, 'Root', "Project Root",
+                                          os.path.normpath(root_path))]
+        self.analyzed.connect(self.on_analyzed)
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index(self, row, column, parent=QModelIndex()):
+        children = self.node(parent).children
+        if children is None or not 0 <= row < len(children):
+            return QModelIndex()
+        return self.createIndex(row, column, children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is self.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        children = self.node(parent).children
+        return len(children) if children is not None else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 2
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return ("Symbol", "Type")[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return node.label if index.column() == 0 else node.type_label
+        if role == Qt.ItemDataRole.DecorationRole and index.column() == 0:
+            pixmap = ICONS.get(node.kind)
+            return self.icon(pixmap) if pixmap is not None else None
+        return None
+
+    def icon(self, pixmap):
+        icon = self.icons.get(pixmap)
+        if icon is None:
+            icon = self.icons[pixmap] = self.style.standardIcon(pixmap)
+        return icon
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if node.children is not None:
+            return bool(node.children)
+        if node.kind in ('Root', 'Directory'):
+            return True
+        if node.kind == 'File':
+            return node.symbols != '[]'
+        return bool(node.symbols)
+
+    def canFetchMore(self, parent):
+        return parent.isValid() and parent.internalPointer().children is None and \
+            self.hasChildren(parent)
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        if node.children is not None:
+            return
+        if node.kind in ('Root', 'Directory'):
+            children = self.list_directory(node)
+        elif node.kind == 'File':
+            if node.symbols is None:
+                # Filled in by on_analyzed once the worker is done
+                self.waiting.add(node)
+                return
+            children = self.symbol_nodes(node, json.loads(node.symbols))
+        else:
+            children = self.symbol_nodes(node, node.symbols, node.kind == 'ClassDef')
+        if not children:
+            node.children = []
+            return
+        self.beginInsertRows(parent, 0, len(children) - 1)
+        node.children = children
+        self.endInsertRows()
+
+    def list_directory(self, node):
+        """Rows for the subdirectories and Python files of a directory, the
+        files that are not cached are queued for the workers"""
+        children = []
+        jobs = []
+        try:
+            entries = sorted(os.scandir(node.key), key=lambda e: (not e.is_dir(), e.name.lower()))
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.py'):
+                    key = os.path.normpath(entry.path)
+                    child = OutlineNode(node, len(children), 'File', entry.name, key,
+                                        self.cache.lookup(key, entry.stat()))
+                    if child.symbols is None:
+                        self.files[key] = child
+                        if key not in self.queued:
+                            self.queued.add(key)
+                            jobs.append((key, self.cache.digest(key)))
+                    children.append(child)
+
+                elif entry.is_dir() and not entry.name.startswith('.'):
+                    children.append(OutlineNode(node, len(children), 'Directory', entry.name,
+                                                os.path.normpath(entry.path)))
+        except OSError as e:
+            children.append(OutlineNode(node, len(children), 'Error', f"Error: {e}", None))
+        self.queue_jobs(jobs)
+        return children
+
+    def symbol_nodes(self, parent, symbols, in_class=False):
+        """Rows for one level of symbols, imports grouped under a header"""
+        if parent.kind == 'Section':
+            return [OutlineNode(parent, row, symbol['type'], symbol['name'], None)
+                    for row, symbol in enumerate(symbols)]
+        prefix = parent.key + (SYMBOL_SEPARATOR if parent.kind == 'File' else '/')
+        children = []
+        imports = []
+        for symbol in symbols:
+            kind = symbol['type']
+            if kind in ('ImportFrom', 'Import'):
+                if not imports:
+                    children.append(OutlineNode(parent, len(children), 'Section', "Imports",
+                                                prefix + "Imports", imports))
+                imports.append(symbol)
+                continue
+            if kind in ('FunctionDef', 'AsyncFunctionDef'):
+                label = f"{symbol['name']}({', '.join(symbol['args'])})"
+            elif kind == 'Error':
+                label = f"Error: {symbol['name']}"
+            else:
+                label = symbol['name']
+            children.append(OutlineNode(parent, len(children), kind, label,
+                                        prefix + symbol['name'], symbol['children'], in_class))
+        return children
+
+    def queue_jobs(self, jobs):
+        if not jobs:
+            return
+        if self.pool is None:
+            self.start_pool()
+        size = 1
+        start = 0
+        while start < len(jobs):
+            batch = jobs[start:start + size]
+            try:
+                future = self.pool.submit(analyze_batch, batch)
+            except BrokenProcessPool:
+                # A worker died and took the pool with it, its batches came
+                # back as errors: carry on with a fresh one
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.start_pool()
+                future = self.pool.submit(analyze_batch, batch)
+            future.add_done_callback(lambda future, batch=batch: self._emit_analyzed(batch, future))
+            self.pending += 1
+            start += size
+            size = min(size * 2, MAX_BATCH)
+
+    def start_pool(self):
+        # spawn: forking a process that runs Qt is not safe
+        self.pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+
+    def _emit_analyzed(self, batch, future):
+        # Runs on the executor's thread, the signal queues it to the GUI thread
+        try:
+            self.analyzed.emit(batch, future)
+        except RuntimeError:
+            pass  # the model is gone
+
+    def on_analyzed(self, batch, future):
+        if future.cancelled():
+            return
+        try:
+            results = future.result()
+        except Exception as e:
+            results = [(path, None, None, None, dump_symbols(error_symbols(e))) for path, _ in batch]
+        indexed = False
+        reparse = []
+        for file_path, size, mtime_ns, digest, symbols in results:
+            self.queued.discard(file_path)
+            if size is not None:
+                symbols = self.cache.store(file_path, size, mtime_ns, digest, symbols)
+                if symbols is None:
+                    # The worker only confirmed the cached outline, which
+                    # was evicted since: parse the file after all
+                    self.queued.add(file_path)
+                    reparse.append((file_path, None))
+                    continue
+            if self.scanned is not None or self.scan is not None:
+                if size is None:
+                    self.symbol_index.remove_file(file_path)
+                    indexed = True
+                elif self.symbol_index.digest(file_path) != digest:
+                    self.symbol_index.update_file(file_path, digest, json.loads(symbols))
+                    indexed = True
+            node = self.files.pop(file_path, None)
+            if node is None:
+                continue
+            node.symbols = symbols
+            index = self.createIndex(node.row, 0, node)
+            if node in self.waiting:
+                self.waiting.discard(node)
+                self.fetchMore(index)
+            # The expand arrow may have to go
+            self.dataChanged.emit(index, index)
+        self.queue_jobs(reparse)
+        self.pending -= 1
+        if not self.pending:
+            self.cache.save()
+        if indexed:
+            self.indexed.emit()
+
+    def update_index(self):
+        """Start a scan for files changed since the last one, unless one is
+        running or the last finished less than RESCAN_INTERVAL ago"""
+        if self.scan is None and (self.scanned is None or
+                                  time.monotonic() - self.scanned > RESCAN_INTERVAL):
+            self.scan = self.scan_project()
+            QTimer.singleShot(0, self.scan_step)
+
+    def scan_step(self):
+        # A slice of the scan at a time, so typing stays responsive
+        deadline = time.monotonic() + 0.02
+        try:
+            while time.monotonic() < deadline:
+                next(self.scan)
+        except StopIteration:
+            self.scan = None
+            self.scanned = time.monotonic()
+        else:
+            QTimer.singleShot(0, self.scan_step)
+        self.indexed.emit()
+
+    def scan_project(self):
+        """Brings the search index up to date one file per step: outlines
+        cached for unchanged files are indexed unless they already are,
+        other files go to the workers, files that are gone are dropped"""
+        index = self.symbol_index
+        seen = set()
+        jobs = []
+        for dir_path, dir_names, file_names in os.walk(self.root.children[0].key):
+            dir_names[:] = sorted(name for name in dir_names if not name.startswith('.'))
+            for file_name in sorted(file_names):
+                if not file_name.endswith('.py'):
+                    continue
+                key = os.path.normpath(os.path.join(dir_path, file_name))
+                seen.add(key)
+                try:
+                    symbols = self.cache.lookup(key, os.stat(key))
+                except OSError:
+                    continue
+                digest = self.cache.digest(key)
+                if symbols is None:
+                    if key not in self.queued:
+                        self.queued.add(key)
+                        jobs.append((key, digest))
+                elif index.digest(key) != digest:
+                    index.update_file(key, digest, json.loads(symbols))
+                yield
+        self.queue_jobs(jobs)
+        for key in [key for key in index.files if key not in seen and key not in self.queued]:
+            index.remove_file(key)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        self.cache.forget_missing()
+        self.cache.save()
+
+class ProjectViewer(QMainWindow):
+    def __init__(self, path: str = '.'):
         super().__init__()
         self.setWindowTitle("Python Project Outline")
         self.setGeometry(100, 100, 1000, 900)
-        
+
         # Main widget and layout
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
         layout = QVBoxLayout(main_widget)
-        
-        # Create outline tree
-        self.outline = QTreeWidget()
-        self.outline.setHeaderLabels(["Symbol", "Type"])
+
+        # Create outline tree, rows are only made for what gets expanded
+        self.model = OutlineModel(path, self.style(), self)
+        self.outline = QTreeView()
+        self.outline.setModel(self.model)
+        self.outline.setUniformRowHeights(True)
         self.outline.setColumnWidth(0, 400)
-        
+
+        # Symbol search over the whole project, results replace the tree
+        # while there is a query
+        self.search = QLineEdit()
+        self.search.setPlaceholderText("Search symbols (fuzzy, e.g. gtusr for get_user)")
+        self.search.setClearButtonEnabled(True)
+        self.results = QListWidget()
+        self.results.hide()
+        self.search.textChanged.connect(self.on_search_changed)
+        self.search.returnPressed.connect(self.open_first_result)
+        self.results.itemActivated.connect(self.open_result)
+        # Reruns the query once a burst of index updates is over
+        self.research = QTimer(self)
+        self.research.setSingleShot(True)
+        self.research.setInterval(100)
+        self.research.timeout.connect(self.run_search)
+        self.model.indexed.connect(self.research.start)
+        self.reveal_key = None
+
         # Set font
         font = QFont("Consolas" if os.name == 'nt' else "Monospace")
         font.setPointSize(10)
         self.outline.setFont(font)
-        
+        self.results.setFont(font)
+
         # Style improvements
         self.outline.setAlternatingRowColors(True)
         self.outline.setStyleSheet("""
-            QTreeWidget {
+            QTreeView, QListWidget {
                 background-color: #2b2b2b;
                 color: #d4d4d4;
                 border: 1px solid #3c3c3c;
             }
-            QTreeWidget::item:hover {
+            QTreeView::item:hover, QListWidget::item:hover {
                 background-color: #3c3c3c;
             }
-            QTreeWidget::item:selected {
+            QTreeView::item:selected, QListWidget::item:selected {
                 background-color: #094771;
             }
             QHeaderView::section {
@@ -86,103 +821,107 @@ class ProjectViewer(QMainWindow):
                 border: 1px solid #3c3c3c;
             }
         """)
-        
+
+        self.results.setStyleSheet(self.outline.styleSheet())
+
+        layout.addWidget(self.search)
+        layout.addWidget(self.results)
         layout.addWidget(self.outline)
-        
-        self.analyzer = FileAnalyzer()
-        self.icon_provider = self.style()
-        
-        # Scan directory
-        self.scan_directory()
-
-    def scan_directory(self, path: str = '.'):
-        """Recursively scan directory for Python files"""
-        self.outline.clear()
-        root_item = QTreeWidgetItem(self.outline)
-        root_item.setText(0, "Project Root")
-        root_item.setText(1, "Root")
-        root_item.setIcon(0, self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon))
-        
-        self._scan_directory_recursive(Path(path), root_item)
-        root_item.setExpanded(True)
-
-    def _scan_directory_recursive(self, path: Path, parent_item: QTreeWidgetItem):
-        """Helper method for recursive directory scanning"""
-        try:
-            for entry in os.scandir(path):
-                if entry.is_file() and entry.name.endswith('.py'):
-                    file_item = QTreeWidgetItem(parent_item)
-                    file_item.setText(0, entry.name)
-                    file_item.setText(1, "File")
-                    file_item.setIcon(0, self.style().standardIcon(QStyle.StandardPixmap.SP_FileIcon))
-                    
-                    # Analyze file content
-                    symbols = self.analyzer.analyze_python_file(Path(entry.path))
-                    self.add_symbols(file_item, symbols, entry.path)
-                    file_item.setExpanded(True)
-                
-                elif entry.is_dir() and not entry.name.startswith('.'):
-                    dir_item = QTreeWidgetItem(parent_item)
-                    dir_item.setText(0, entry.name)
-                    dir_item.setText(1, "Directory")
-                    dir_item.setIcon(0, self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon))
-                    self._scan_directory_recursive(Path(entry.path), dir_item)
-                    dir_item.setExpanded(True)
-        
-        except Exception as e:
-            error_item = QTreeWidgetItem(parent_item)
-            error_item.setText(0, f"Error: {str(e)}")
-            error_item.setText(1, "Error")
-
-    def add_symbols(self, parent: QTreeWidgetItem, symbols: list, file_path: str):
-        """Add symbols to the outline tree"""
-        symbols_by_class = {}
-        
-        for symbol in symbols:
-            if symbol['type'] in ('ImportFrom', 'Import'):
-                imports_header = self._get_or_create_header(parent, "Imports")
-                item = QTreeWidgetItem(imports_header)
-                item.setText(0, symbol['name'])
-                item.setText(1, "Import")
-                item.setIcon(0, self.style().standardIcon(QStyle.StandardPixmap.SP_ArrowRight))
-                
-            elif symbol['type'] == 'ClassDef':
-                class_item = QTreeWidgetItem(parent)
-                class_item.setText(0, symbol['name'])
-                class_item.setText(1, "Class")
-                class_item.setIcon(0, self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon))
-                symbols_by_class[symbol['name']] = class_item
-                
-            elif symbol['type'] == 'FunctionDef':
-                is_method = False
-                for node in ast.walk(ast.parse(open(file_path).read())):
-                    if (isinstance(node, ast.ClassDef) and 
-                        symbol['lineno'] > node.lineno and 
-                        symbol['lineno'] < node.end_lineno):
-                        if node.name in symbols_by_class:
-                            is_method = True
-                            item = QTreeWidgetItem(symbols_by_class[node.name])
-                            break
-                
-                if not is_method:
-                    item = QTreeWidgetItem(parent)
-                
-                args_str = f"({', '.join(symbol['args'])})"
-                item.setText(0, symbol['name'] + args_str)
-                item.setText(1, "Method" if is_method else "Function")
-                item.setIcon(0, self.style().standardIcon(QStyle.StandardPixmap.SP_FileIcon))
-
-    def _get_or_create_header(self, parent: QTreeWidgetItem, header_text: str) -> QTreeWidgetItem:
-        """Get existing header or create new one"""
-        for i in range(parent.childCount()):
-            if parent.child(i).text(0) == header_text:
-                return parent.child(i)
-        
-        header = QTreeWidgetItem(parent)
-        header.setText(0, header_text)
-        header.setText(1, "Section")
-        header.setIcon(0, self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon))
-        return header
+
+        # Rows expanded in earlier sessions are expanded again as they appear,
+        # the first time only the project root is
+        cache = self.model.cache
+        if not cache.expanded:
+            cache.expanded.add(self.model.root.children[0].key)
+        self.to_expand = []
+        self.outline.expanded.connect(lambda index: self.remember_expanded(index, True))
+        self.outline.collapsed.connect(lambda index: self.remember_expanded(index, False))
+        self.model.rowsInserted.connect(self.restore_expanded)
+        self.restore_expanded(QModelIndex(), 0, 0)
+
+    def remember_expanded(self, index, expanded):
+        key = self.model.node(index).key
+        if key is not None:
+            self.model.cache.set_expanded(key, expanded)
+
+    def restore_expanded(self, parent, first, last):
+        expanded = self.model.cache.expanded
+        for row in range(first, last + 1):
+            index = self.model.index(row, 0, parent)
+            if self.model.node(index).key in expanded:
+                self.to_expand.append(index)
+        if self.to_expand:
+            # Not from inside the insertion, the view is still handling it
+            QTimer.singleShot(0, self.expand_pending)
+        if self.reveal_key is not None and contains_key(self.model.node(parent).key,
+                                                        self.reveal_key):
+            # The rows on the way to a search result arrived
+            QTimer.singleShot(0, lambda: self.reveal_from(parent))
+
+    def expand_pending(self):
+        pending, self.to_expand = self.to_expand, []
+        for index in pending:
+            self.outline.expand(index)
+
+    def on_search_changed(self, text):
+        self.model.update_index()
+        self.run_search()
+
+    def run_search(self):
+        query = self.search.text()
+        self.results.setVisible(bool(query.strip()))
+        self.outline.setVisible(not query.strip())
+        if not query.strip():
+            return
+        hits = self.model.symbol_index.search(query, SEARCH_RESULTS)
+        self.results.setUpdatesEnabled(False)
+        self.results.clear()
+        for hit in hits:
+            item = QListWidgetItem(self.model.icon(ICONS[hit['type']]),
+                                   f"{hit['name']:<40} {hit['path']}:{hit['lineno']}")
+            item.setData(Qt.ItemDataRole.UserRole, hit['key'])
+            self.results.addItem(item)
+        if hits:
+            self.results.setCurrentRow(0)
+        self.results.setUpdatesEnabled(True)
+
+    def open_first_result(self):
+        item = self.results.currentItem()
+        if item is not None:
+            self.open_result(item)
+
+    def open_result(self, item):
+        key = item.data(Qt.ItemDataRole.UserRole)
+        self.search.clear()
+        self.reveal_key = key
+        self.reveal_from(self.model.index(0, 0))
+
+    def reveal_from(self, index):
+        """Expand from index down to the row of reveal_key and select it,
+        rows not there yet continue it from restore_expanded"""
+        model = self.model
+        while self.reveal_key is not None:
+            node = model.node(index)
+            if node.key == self.reveal_key:
+                self.reveal_key = None
+                self.outline.setCurrentIndex(index)
+                self.outline.scrollTo(index, QTreeView.ScrollHint.PositionAtCenter)
+                return
+            if model.canFetchMore(index):
+                model.fetchMore(index)
+            self.outline.expand(index)
+            if node.children is None:
+                return  # the file's outline is still with a worker
+            for child in node.children:
+                if child.key is not None and contains_key(child.key, self.reveal_key):
+                    index = model.index(child.row, 0, index)
+                    break
+            else:
+                self.reveal_key = None  # the file changed since it was indexed
+
+    def closeEvent(self, event):
+        self.model.close()
+        super().closeEvent(event)
 
 def main():
     app = QApplication(sys.argv)
@@ -191,4 +930,4 @@ def main():
     sys.exit(app.exec())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,644 @@
+import os
+import stat
+import shutil
+import time
+import functools
+from datetime import datetime
+from helpers.snapshot_store import SnapshotStore, diff_files, saved_mode, DEFAULT_MODE
+from helpers.scan_cache import ScanCache
+from helpers.inotify_watch import InotifyWatcher
+from helpers.hashing import FileHasher
+from helpers.save_pipeline import SavePipeline
+from helpers.ignore_rules import IgnoreMatcher
+from helpers.chunking import CHUNK_THRESHOLD
+from helpers.retention import RetentionPolicy
+from helpers.autosave import AutosavePolicy
+from helpers.store_gc import StoreCollector
+from helpers.file_state import FileState
+from helpers.save_diff import SaveDiff
+from helpers.save_archive import ArchiveWriter, ArchiveReader
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+def format_dedup(dedup):
+    if not dedup['written']:
+        return "all chunks reused"
+    return f"dedup {dedup['bytes'] / dedup['written']:.1f}x"
+
+def describe_save(entry):
+    """One line for a catalogue entry, as listed by the GUI and the CLI"""
+    details = f"{entry['files']} files, +{format_size(entry['bytes'])}"
+    if entry.get('dedup'):
+        details += f", {format_dedup(entry['dedup'])}"
+    return f"{entry['timestamp']} - {entry['comment']} ({details})"
+
+def locked(method):
+    """Run an engine method holding the lock on .saves, so the GUI, a CLI
+    watcher and one-off CLI commands never write to the store at once"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.store.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def change_lines(old_files, changed, deleted):
+    """New/Modified/Deleted lines for a diff against old_files"""
+    changes = []
+
+    # Check for new and modified files
+    for file in changed:
+        if file not in old_files:
+            changes.append(f"New: {file}")
+        else:
+            changes.append(f"Modified: {file}")
+
+    # Check for deleted files
+    for file in deleted:
+        changes.append(f"Deleted: {file}")
+    return changes
+
+class TrackerEngine:
+    """Scanning, saving, restoring and pruning for one working directory.
+
+    Has no Qt dependency: the GUI drives it from a worker thread and the
+    CLI from a plain loop. Nothing here is thread-safe, every call must come
+    from the same thread. Other processes may share .saves: everything
+    that touches the store holds its lock, and picks up what they wrote
+    when taking it."""
+
+    def __init__(self, cwd):
+        self.cwd = cwd
+        self.saves_dir = os.path.join(self.cwd, '.saves')
+        # Files up to object_limit bytes are stored in compressed packs
+        # (codec 'zlib' or 'lzma'), set pack_small_files to False for one file per object
+        self.pack_small_files = True
+        self.pack_options = {'object_limit': 64 * 1024, 'max_pack_size': 64 * 1024 * 1024,
+                             'codec': 'zlib', 'level': 6}
+        self.store = SnapshotStore(self.saves_dir,
+                                   self.pack_options if self.pack_small_files else None)
+
+        self.ignore_dirs = {'.tracker_status', '.outline_cache', '.saves', '.git', '__pycache__', '.venv', 'venv', 'env', 'node_modules', '.pytest_cache'}
+        self.ignore_extensions = {'.pyc', '.pyo', '.pyd', '.so', '.git'}
+        # Patterns from .gitignore and .sftmignore are added on top of these
+        self.ignore_matcher = IgnoreMatcher(self.cwd, self.ignore_dirs, self.ignore_extensions)
+
+        # Files are only rehashed when their stat data changes, plus a full
+        # paranoid rehash every so often (0 disables it)
+        self.paranoid_rehash_interval = 30  # minutes
+        self.scan_cache = ScanCache(self.paranoid_rehash_interval * 60)
+        # The cache is kept across runs, so startup only rehashes files that
+        # changed while the tracker was closed
+        self.scan_index_path = os.path.join(self.saves_dir, 'index')
+
+        # Digest used for change detection and object names: blake2b, sha256 or md5.
+        # Files above the size cap are tracked by size and mtime only.
+        self.hash_algorithm = 'blake2b'
+        self.max_hash_size = 1024 * 1024 * 1024
+        self.hasher = FileHasher(self.hash_algorithm, self.max_hash_size)
+        # Saves reflink large files where the filesystem supports it (btrfs, XFS).
+        # Hard links are faster still but alias the working file, so they are
+        # only safe when every editor writes by rename.
+        self.hardlink_saves = False
+        # Large files that cannot be reflinked are stored as content-defined
+        # chunks, so a partly changed checkpoint only adds its new chunks (None disables)
+        self.chunk_threshold = CHUNK_THRESHOLD
+        self.pipeline = SavePipeline(self.store, self.hash_algorithm, self.max_hash_size,
+                                     self.hardlink_saves, self.chunk_threshold)
+        # Called with (done, total) while a save runs, at most ten times a second
+        self.progress_callback = None
+        self.last_progress = 0
+
+        # Event-driven change detection, polling is used when inotify is unavailable
+        self.use_inotify = True
+        self.watcher = None
+        self.current_files = None
+        self.checked_state = None
+        self.pending_paths = set()
+        self.needs_rescan = False
+        self.state_version = 0
+        # Permission bits of the files last seen with other than DEFAULT_MODE
+        self.modes = {}
+
+        # Saves are written as deltas against the previous save, the diff
+        # from the last check_changes is reused when it is still current
+        self.last_state = FileState()
+        self.last_save_id = None
+        self.parent_files = None
+        self.changes = None
+
+        # Autosaves follow the change stream: after a quiet period, or a
+        # maximum delay while edits keep coming
+        self.autosave = AutosavePolicy()
+
+        # Files that did not exist in a restored save: 'quarantine' moves them
+        # to .saves/quarantine/<timestamp>, 'delete' removes them, 'keep' leaves them
+        self.restore_extras = 'quarantine'
+
+        # Old saves are pruned by the retention policy and unreferenced objects
+        # collected in small steps between scans, at most every collect_interval
+        self.retention = RetentionPolicy()
+        self.collector = StoreCollector(self.store, self.retention)
+        self.collect_interval = 10 * 60  # seconds
+        self.last_collect = None
+
+    def open(self, watch=True):
+        """Write the initial save or find the last one. With watch, start
+        the file watcher and take the state changes are reported against."""
+        if watch and self.use_inotify:
+            self.start_watcher()
+        self.scan_cache.load(self.scan_index_path, self.hash_algorithm, self.max_hash_size)
+        # Checked before the lock file creates the directory
+        new_store = not os.path.exists(self.saves_dir)
+        with self.store.lock:
+            saves = self.store.list_saves()
+            if new_store and not saves:
+                self.save_state("Initial state")
+            else:
+                self.last_save_id = saves[-1] if saves else None
+            if watch:
+                self.last_state = self.scan()
+                parent_files = self.get_parent_files()
+                if parent_files is not None and parent_files is not self.last_state and \
+                        not any(diff_files(parent_files, self.last_state)):
+                    # Unchanged since the last save: share the state, so the next
+                    # save can reuse the diffs taken against it
+                    self.parent_files = self.last_state
+                self.save_scan_index()
+
+    def save_scan_index(self):
+        if not os.path.isdir(self.saves_dir):
+            return
+        try:
+            self.scan_cache.save(self.scan_index_path, self.hash_algorithm, self.max_hash_size)
+        except OSError as e:
+            print(f"Error writing scan index: {e}")
+
+    def close(self):
+        self.collector.cancel()
+        self.save_scan_index()
+        self.stop_watcher()
+        self.hasher.shutdown()
+        self.store.close()
+
+    def set_retention(self, policy):
+        self.retention = self.collector.policy = policy
+
+    def set_autosave(self, policy):
+        # Unsaved changes seen so far still count under the new settings
+        policy.first_change = self.autosave.first_change
+        policy.last_change = self.autosave.last_change
+        self.autosave = policy
+
+    def autosave_if_due(self):
+        """Autosave if the policy says so, reusing the diff of the check that
+        just ran. Returns whether a save was written."""
+        if not self.autosave.due():
+            return False
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        saved = self.save_state(f"Autosave at {timestamp}", only_if_changed=True,
+                                reuse_check=True)
+        self.autosave.reset()
+        return saved
+
+    def schedule_collect(self, force=False):
+        """Start a collection pass if retention is on and the last pass is
+        old enough, returns whether one is running"""
+        if not self.retention.enabled:
+            return False
+        if not self.collector.active and (force or self.last_collect is None or
+                                          time.monotonic() - self.last_collect >= self.collect_interval):
+            # The save the next delta is written against must survive
+            self.collector.start(protected={self.last_save_id})
+        return self.collector.active
+
+    @locked
+    def collect_step(self):
+        """Run a time slice of the collection, returns whether work is left"""
+        try:
+            if self.collector.step():
+                return True
+        except Exception:
+            self.collector.cancel()
+            raise
+        finally:
+            if not self.collector.active:
+                self.last_collect = time.monotonic()
+        return False
+
+    def report_progress(self, done, total):
+        now = time.monotonic()
+        if self.progress_callback is not None and \
+                (done == total or now - self.last_progress >= 0.1):
+            self.last_progress = now
+            self.progress_callback(done, total)
+
+    def should_ignore(self, rel_path, is_dir=False):
+        return self.ignore_matcher(rel_path, is_dir)
+
+    def hash_paths(self, paths, files):
+        """Fill files with digests for (rel_path, path, stat) entries, cache misses
+        are hashed together on the hasher's thread pool"""
+        misses = []
+        for rel_path, path, st in paths:
+            self.note_mode(rel_path, st)
+            digest = self.scan_cache.lookup(rel_path, st)
+            if digest is None:
+                misses.append((rel_path, path, st))
+            else:
+                files[rel_path] = digest
+        digests = self.hasher.digest_many([(path, st, rel_path) for rel_path, path, st in misses])
+        for (rel_path, _, st), digest in zip(misses, digests):
+            if digest is not None:
+                self.scan_cache.store(rel_path, st, digest)
+                files[rel_path] = digest
+
+    def note_mode(self, rel_path, st):
+        mode = st.st_mode & 0o7777
+        if mode != DEFAULT_MODE:
+            self.modes[rel_path] = mode
+        else:
+            self.modes.pop(rel_path, None)
+
+    def stat_files(self, top):
+        """(rel_path, path, stat) for every file below top. Ignored directories
+        are never entered and entries are only stat'ed once."""
+        rel_top = os.path.relpath(top, self.cwd)
+        stack = [('' if rel_top == '.' else rel_top + os.sep, top)]
+        while stack:
+            rel_dir, directory = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    rel_path = rel_dir + entry.name
+                    try:
+                        if entry.is_dir():
+                            # Symlinked directories are not followed, as with os.walk
+                            if not entry.is_symlink() and \
+                                    not self.should_ignore(rel_path, True):
+                                stack.append((rel_path + os.sep, entry.path))
+                        elif entry.is_file() and not self.should_ignore(rel_path):
+                            yield rel_path, entry.path, entry.stat()
+                    except OSError:
+                        continue
+
+    def get_files(self):
+        files = {}
+        self.scan_cache.begin_pass()
+        self.hash_paths(self.stat_files(self.cwd), files)
+        self.scan_cache.end_pass(files)
+        return FileState(files)
+
+    def start_watcher(self):
+        watcher = InotifyWatcher(self.cwd, self.should_ignore)
+        try:
+            watcher.start()
+        except OSError as e:
+            print(f"File watcher unavailable, polling instead: {e}")
+            return
+        self.watcher = watcher
+
+    def stop_watcher(self):
+        if self.watcher:
+            self.watcher.close()
+            self.watcher = None
+        self.current_files = None
+        self.pending_paths.clear()
+
+    def read_watch_events(self):
+        if self.watcher is None:
+            return
+        try:
+            paths = self.watcher.read_events()
+        except OSError as e:
+            # Watch limit hit while following a new directory
+            print(f"File watcher failed, falling back to polling: {e}")
+            self.stop_watcher()
+            return
+        if paths is None:
+            self.needs_rescan = True
+        else:
+            self.pending_paths |= paths
+
+    def has_pending_changes(self):
+        self.read_watch_events()
+        return self.watcher is None or self.current_files is None or self.needs_rescan or \
+            bool(self.pending_paths) or self.scan_cache.full_pass_due()
+
+    def scan(self):
+        """Current path -> hash state, from the watcher's view or a full walk"""
+        if self.ignore_matcher.refresh():
+            # Edited ignore rules change which directories are watched and walked
+            if self.watcher is not None:
+                self.stop_watcher()
+                self.start_watcher()
+            self.needs_rescan = True
+        self.read_watch_events()
+        if self.watcher is not None and self.current_files is not None and self.pending_paths:
+            self.apply_watch_events()
+        if self.watcher is None or self.current_files is None or \
+                self.needs_rescan or self.scan_cache.full_pass_due():
+            # Polling mode, queue overflow or paranoid rehash: walk the whole tree
+            self.needs_rescan = False
+            self.pending_paths.clear()
+            files = self.get_files()
+            if self.watcher is not None:
+                self.current_files = files
+                self.state_version += 1
+            return files
+        return self.current_files
+
+    def apply_watch_events(self):
+        paths, self.pending_paths = self.pending_paths, set()
+        self.state_version += 1
+        self.scan_cache.begin_pass(full_allowed=False)
+        changed = {}
+        deleted = set()
+        for rel_path in paths:
+            if not rel_path:
+                self.needs_rescan = True
+                continue
+            self.update_path(rel_path, changed, deleted)
+        self.current_files = self.current_files.updated(changed, deleted)
+
+    def update_path(self, rel_path, changed, deleted):
+        """Record what an event at rel_path changed in changed and deleted"""
+        path = os.path.join(self.cwd, rel_path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+
+        found = {}
+        if st is not None and stat.S_ISREG(st.st_mode):
+            gone = [rel_path]
+            self.hash_paths([(rel_path, path, st)], found)
+        else:
+            # Deleted file, or a directory that appeared or vanished: resync below it
+            prefix = os.path.join(rel_path, '')
+            gone = self.current_files.under(rel_path)
+            gone += [p for p in changed if p == rel_path or p.startswith(prefix)]
+            if st is not None and stat.S_ISDIR(st.st_mode):
+                self.hash_paths(self.stat_files(path), found)
+        for known in gone:
+            changed.pop(known, None)
+            deleted.add(known)
+        changed.update(found)
+        deleted.difference_update(found)
+
+    def get_parent_files(self):
+        if self.parent_files is None and self.last_save_id is not None:
+            try:
+                self.parent_files = self.store.load_files(self.last_save_id)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not load save {self.last_save_id}, writing a full save: {e}")
+                self.last_save_id = None
+        return self.parent_files
+
+    def diff_is_current(self, parent_files, reuse_check=False):
+        """Whether the last check_changes diff is against parent_files and
+        nothing changed on disk since. With reuse_check the caller has just
+        run the check and takes it as current."""
+        if self.changes is None or parent_files is None or self.changes[1] is not parent_files:
+            return False
+        return reuse_check or self.watcher is not None and \
+            not self.has_pending_changes() and self.changes[0] == self.state_version
+
+    def ingest(self, jobs, current_files):
+        """Read, hash and store (rel_path, path, stat) jobs in a single pass"""
+        self.pipeline.run(jobs, current_files, self.report_progress)
+        for rel_path, _, st in jobs:
+            if rel_path in current_files:
+                self.scan_cache.store(rel_path, st, current_files[rel_path])
+
+    @locked
+    def save_state(self, comment, only_if_changed=False, reuse_check=False):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        parent_files = self.get_parent_files()
+
+        if self.diff_is_current(parent_files, reuse_check):
+            # Only the paths check_changes reported need any work
+            _, _, checked_files, changed, deleted = self.changes
+            missing = [p for p in changed if not self.store.has_object(changed[p])]
+            jobs = []
+            for rel_path in missing:
+                path = os.path.join(self.cwd, rel_path)
+                try:
+                    jobs.append((rel_path, path, os.stat(path)))
+                except OSError:
+                    continue
+            stored = {}
+            self.scan_cache.begin_pass(full_allowed=False)
+            self.ingest(jobs, stored)
+            current_files = checked_files.updated(
+                stored, [p for p in missing if p not in stored])
+            changes = ({p: current_files[p] for p in changed if p in current_files},
+                       list(deleted) + [p for p in changed
+                                        if p not in current_files and p in parent_files])
+        else:
+            # Files with a cached hash whose object is already stored cost nothing,
+            # everything else is read once, hashed and written in the same pass
+            current_files = {}
+            jobs = []
+            self.scan_cache.begin_pass()
+            for rel_path, path, st in self.stat_files(self.cwd):
+                self.note_mode(rel_path, st)
+                digest = self.scan_cache.lookup(rel_path, st)
+                if digest is not None and self.store.has_object(digest):
+                    current_files[rel_path] = digest
+                else:
+                    jobs.append((rel_path, path, st))
+            self.ingest(jobs, current_files)
+            self.scan_cache.end_pass(current_files)
+            current_files = FileState(current_files)
+            changes = diff_files(parent_files, current_files) if parent_files is not None else None
+        if self.watcher is not None:
+            self.current_files = current_files
+            self.state_version += 1
+
+        if only_if_changed and changes is not None and not changes[0] and not changes[1]:
+            return False
+        # Deleted files are only dropped here
+        self.modes = {p: mode for p, mode in self.modes.items() if p in current_files}
+        self.last_save_id = self.store.write_manifest(
+            timestamp, comment, current_files, self.hash_algorithm,
+            parent=self.last_save_id, changes=changes,
+            transport=self.pipeline.strategies,
+            bytes_added=self.pipeline.bytes_written + self.pipeline.bytes_linked,
+            dedup=self.pipeline.dedup_stats(), modes=self.modes)
+        self.parent_files = current_files
+        self.last_state = current_files
+        self.collector.protect(self.last_save_id, current_files)
+        self.autosave.reset()
+        self.save_scan_index()
+        return True
+
+    def collect_changes(self):
+        """New/Modified/Deleted lines against last_state, None when the
+        watcher saw nothing since the last check"""
+        # A scan made elsewhere (compare) may have taken in events this
+        # check has not reported yet, so the state version must match too
+        if self.watcher is not None and self.last_state is self.checked_state and \
+                self.changes is not None and self.changes[0] == self.state_version and \
+                not self.has_pending_changes():
+            return None
+        current_files = self.scan()
+        self.checked_state = self.last_state
+        changed, deleted = diff_files(self.last_state, current_files)
+        # Kept for the next save, which only has to write these paths
+        previous = self.changes
+        self.changes = (self.state_version, self.last_state, current_files, changed, deleted)
+        if not changed and not deleted:
+            self.autosave.reset()
+        elif previous is None or previous[1] is not self.last_state or \
+                previous[3] != changed or previous[4] != deleted:
+            self.autosave.note_change()
+        return change_lines(self.last_state, changed, deleted)
+
+    @locked
+    def compare(self, old_id, new_id=None):
+        """SaveDiff from save old_id (None for an empty tree) to save new_id,
+        or to the working tree"""
+        old_files = self.store.load_files(old_id) if old_id else FileState()
+        new_files = self.scan() if new_id is None else self.store.load_files(new_id)
+        # Saves made with another algorithm (md5 before blake2b) have other digests
+        algorithms = tuple(self.store.read_manifest(save_id).get('algorithm', 'md5')
+                           if save_id else self.hash_algorithm for save_id in (old_id, new_id))
+        return SaveDiff(self.store, self.cwd, old_id, new_id, old_files, new_files, algorithms)
+
+    def previous_save(self, save_id):
+        """The save save_id was written against, else the one before it"""
+        saves = self.store.list_saves()
+        entry = self.store.catalog.get(save_id)
+        parent = entry.get('parent') if entry else None
+        if parent and self.store.catalog.get(parent) is not None:
+            return parent
+        i = saves.index(save_id) if save_id in saves else 0
+        return saves[i - 1] if i > 0 else None
+
+    @locked
+    def export_saves(self, fileobj, first, last=None, base=None, compression=''):
+        """Stream saves first to last (inclusive, oldest first) into fileobj as
+        one tar. With base, a save the destination already has, the archive
+        leaves out what base holds. Returns the writer with its totals."""
+        saves = self.store.list_saves()
+        last = last or first
+        for save_id in (first, last, base):
+            if save_id is not None and save_id not in saves:
+                raise ValueError(f"No save {save_id}")
+        ids = saves[saves.index(first):saves.index(last) + 1]
+        if not ids:
+            raise ValueError(f"{first} is newer than {last}")
+        writer = ArchiveWriter(self.store, fileobj, compression)
+        try:
+            writer.write(ids, base)
+        finally:
+            writer.close()
+        return writer
+
+    @locked
+    def import_saves(self, fileobj):
+        """Add the saves of an archive to the store, returns the reader with
+        the ids written and its totals"""
+        os.makedirs(self.saves_dir, exist_ok=True)
+        reader = ArchiveReader(self.store, fileobj)
+        try:
+            reader.read()
+        finally:
+            reader.close()
+            self.store.flush()
+        for save_id in reader.saves:
+            # A collection that already marked the store must not sweep them
+            self.collector.protect(save_id, self.store.load_files(save_id))
+        return reader
+
+    @locked
+    def restore_save(self, save_id):
+        """Bring the working tree to save_id, rewriting only files that differ"""
+        # Load the saved state, replaying incremental saves up to this one
+        saved_state = self.store.read_manifest(save_id)
+        saved_files = self.store.load_files(save_id)
+        comparable = saved_state.get('algorithm', 'md5') == self.hash_algorithm
+        current_files = self.scan()
+        if comparable:
+            differing, extras = diff_files(current_files, saved_files)
+        else:
+            # Digests from an older algorithm can't be compared, restore everything
+            differing = saved_files
+            extras = [f for f in current_files if f not in saved_files]
+
+        written = failed = 0
+        for file, digest in differing.items():
+            dst = os.path.join(self.cwd, file)
+            try:
+                # From the object store, a pack or an old full-copy save
+                if not self.store.restore_file(save_id, saved_state, saved_files, file, dst):
+                    failed += 1
+                    continue
+                if comparable:
+                    self.scan_cache.store(file, os.stat(dst), digest)
+                written += 1
+            except OSError as e:
+                print(f"Error restoring {file}: {e}")
+                failed += 1
+
+        # Files whose content is already right may still have other permissions
+        modes = saved_state.get('modes')
+        if modes is not None:
+            for file in set(modes) | set(self.modes):
+                mode = saved_mode(saved_state, file)
+                if file in saved_files and file not in differing and \
+                        self.modes.get(file, DEFAULT_MODE) != mode:
+                    try:
+                        os.chmod(os.path.join(self.cwd, file), mode)
+                    except OSError as e:
+                        print(f"Error restoring the mode of {file}: {e}")
+                        failed += 1
+
+        removed = self.remove_extra_files(extras)
+
+        self.last_save_id = save_id
+        self.autosave.reset()
+        if comparable:
+            self.last_state = saved_files
+            self.parent_files = saved_files
+        else:
+            self.last_state = self.scan()
+            self.parent_files = None
+        return written, removed, failed
+
+    def remove_extra_files(self, files):
+        if self.restore_extras == 'keep' or not files:
+            return 0
+        quarantine = os.path.join(self.saves_dir, 'quarantine',
+                                  datetime.now().strftime("%Y%m%d_%H%M%S"))
+        removed = 0
+        for file in files:
+            path = os.path.join(self.cwd, file)
+            try:
+                if self.restore_extras == 'quarantine':
+                    dst = os.path.join(quarantine, file)
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    shutil.move(path, dst)
+                else:
+                    os.remove(path)
+                removed += 1
+            except OSError as e:
+                print(f"Error removing {file}: {e}")
+                continue
+            # Drop directories the removal left empty
+            parent = os.path.dirname(path)
+            while parent != self.cwd:
+                try:
+                    os.rmdir(parent)
+                except OSError:
+                    break
+                parent = os.path.dirname(parent)
+        return removed
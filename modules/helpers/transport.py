@@ -0,0 +1,73 @@
+import os
+import errno
+import shutil
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl(dst, FICLONE, src) shares src's extents with dst on btrfs/XFS
+FICLONE = 0x40049409
+
+REFLINK = 'reflink'
+HARDLINK = 'hardlink'
+COPY = 'copy'
+# Stored as content-defined chunks by the save pipeline
+CHUNKED = 'chunked'
+
+# Errors meaning the filesystem can't do it, as opposed to a failed read or write
+UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+               errno.ENOSYS, errno.EPERM, errno.EMLINK}
+
+class Transport:
+    """Moves file contents between the tree and the object store as cheaply as
+    the filesystem allows: reflink, then hard link, then a plain copy"""
+
+    def __init__(self):
+        # None until tried, then whether the filesystem supports it
+        self.reflink_ok = None if fcntl is not None else False
+        self.hardlink_ok = None
+
+    def reflink(self, src, dst):
+        if self.reflink_ok is False:
+            return False
+        try:
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError as e:
+            if os.path.exists(dst):
+                os.remove(dst)
+            if e.errno not in UNSUPPORTED:
+                raise
+            if not self.reflink_ok:
+                self.reflink_ok = False
+            return False
+        self.reflink_ok = True
+        return True
+
+    def hardlink(self, src, dst):
+        if self.hardlink_ok is False:
+            return False
+        try:
+            os.link(src, dst)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED:
+                raise
+            if not self.hardlink_ok:
+                self.hardlink_ok = False
+            return False
+        self.hardlink_ok = True
+        return True
+
+    def clone(self, src, dst, allow_hardlink=False):
+        """Give dst the content, mode and mtime of src, returns the strategy used.
+
+        Hard links share the inode, so they are only allowed when neither
+        side is ever written in place."""
+        if self.reflink(src, dst):
+            shutil.copystat(src, dst)
+            return REFLINK
+        if allow_hardlink and self.hardlink(src, dst):
+            return HARDLINK
+        shutil.copy2(src, dst)
+        return COPY
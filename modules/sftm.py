@@ -1,44 +1,390 @@
 import os
-import shutil
-import json
-import hashlib
-from datetime import datetime
 from PyQt6.QtWidgets import *
-from PyQt6.QtCore import QTimer, Qt
+from PyQt6.QtCore import QTimer, Qt, QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import QFont, QColor
 from subprocess import Popen
 import sys
 from pathlib import Path
+from helpers.tracker_engine import TrackerEngine, describe_save, format_size
+from helpers.retention import RetentionPolicy
+from helpers.autosave import AutosavePolicy
+from helpers.save_archive import compression_for
+
+class SaveList(QListWidget):
+    """Save list read from the catalogue, older pages load while scrolling.
+    Pages come from the worker, only its thread touches the store."""
+    PAGE_SIZE = 100
+    request_page = pyqtSignal(int, int)  # offset, limit
+
+    def __init__(self, worker, parent=None):
+        super().__init__(parent)
+        self.entries = []
+        self.total = None
+        self.loading = False
+        self.request_page.connect(worker.page_saves)
+        worker.saves_paged.connect(self.add_page)
+        self.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        self.load_page()
+
+    def load_page(self):
+        if not self.loading:
+            self.loading = True
+            self.request_page.emit(len(self.entries), self.PAGE_SIZE)
+
+    def add_page(self, offset, entries, total):
+        if not self.loading or offset != len(self.entries):
+            return  # a page for another list
+        self.loading = False
+        self.total = total
+        for entry in entries:
+            self.addItem(QListWidgetItem(describe_save(entry)))
+        self.entries += entries
+        if offset == 0 and self.count():
+            self.setCurrentRow(0)
+
+    def on_scroll(self, value):
+        if value >= self.verticalScrollBar().maximum() and \
+                self.total is not None and len(self.entries) < self.total:
+            self.load_page()
+
+    def selected_entry(self):
+        row = self.currentRow()
+        return self.entries[row] if 0 <= row < len(self.entries) else None
+
+    def selected_save(self):
+        entry = self.selected_entry()
+        return entry['id'] if entry else None
+
+class SavePicker(QDialog):
+    def __init__(self, worker, parent=None, title='Restore'):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.resize(500, 400)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel('Select save:'))
+        self.list = SaveList(worker)
+        self.list.itemDoubleClicked.connect(self.accept)
+        layout.addWidget(self.list)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok |
+                                   QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def selected_save(self):
+        return self.list.selected_save()
+
+class DiffViewer(QDialog):
+    """Changes made by each save, or from a save to the working tree.
+
+    File lists come from the worker as SaveDiffs, a file's line diff is
+    only requested when its entry is expanded."""
+    request_compare = pyqtSignal(str, bool)  # save, against the working tree
+    request_text_diff = pyqtSignal(object, object)
+
+    def __init__(self, worker, parent=None):
+        super().__init__(parent)
+        # Deleted once closed, which also disconnects it from the worker
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        self.setWindowTitle('Compare Saves')
+        self.resize(900, 500)
+        self.current = None
+        self.wanted = None
+
+        self.saves = SaveList(worker)
+        self.saves.currentRowChanged.connect(self.compare_selected)
+        self.worktree_checkbox = QCheckBox("Compare with working tree")
+        self.worktree_checkbox.stateChanged.connect(self.compare_selected)
+        self.summary = QLabel()
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.setUniformRowHeights(True)
+        self.tree.itemExpanded.connect(self.expand)
+
+        right = QVBoxLayout()
+        right.addWidget(self.worktree_checkbox)
+        right.addWidget(self.summary)
+        right.addWidget(self.tree)
+        layout = QHBoxLayout(self)
+        layout.addWidget(self.saves, 1)
+        layout.addLayout(right, 2)
+
+        self.request_compare.connect(worker.compare)
+        self.request_text_diff.connect(worker.text_diff)
+        worker.compared.connect(self.show_diff)
+        worker.text_diffed.connect(self.show_text_diff)
+        self.compare_selected()
+
+    def compare_selected(self):
+        row = self.saves.currentRow()
+        if row < 0:
+            return
+        self.wanted = (self.saves.entries[row]['id'], self.worktree_checkbox.isChecked())
+        self.summary.setText("Comparing...")
+        self.request_compare.emit(*self.wanted)
+
+    def show_diff(self, diff):
+        # Results for selections the user already scrolled past are dropped
+        if ((diff.old_id, True) if diff.new_id is None else (diff.new_id, False)) != self.wanted:
+            return
+        self.current = diff
+        self.tree.clear()
+        counts = {}
+        for change in diff.changes:
+            counts[change.status] = counts.get(change.status, 0) + 1
+            item = QTreeWidgetItem([str(change)])
+            item.setData(0, Qt.ItemDataRole.UserRole, change)
+            item.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.ShowIndicator)
+            self.tree.addTopLevelItem(item)
+        target = diff.new_id or "working tree"
+        self.summary.setText(f"{diff.old_id or 'nothing'} -> {target}: " + (
+            ", ".join(f"{n} {status}" for status, n in sorted(counts.items())) or "no changes"))
+
+    def expand(self, item):
+        change = item.data(0, Qt.ItemDataRole.UserRole)
+        if change is None or item.childCount() or self.current is None:
+            return
+        item.addChild(QTreeWidgetItem(["Loading..."]))
+        self.request_text_diff.emit(self.current, change)
+
+    def show_text_diff(self, diff, change, lines):
+        if diff is not self.current:
+            return
+        for i in range(self.tree.topLevelItemCount()):
+            item = self.tree.topLevelItem(i)
+            if item.data(0, Qt.ItemDataRole.UserRole) is change:
+                break
+        else:
+            return
+        item.takeChildren()
+        font = QFont("monospace")
+        font.setStyleHint(QFont.StyleHint.Monospace)
+        for line in lines or ["No line changes"]:
+            child = QTreeWidgetItem([line])
+            child.setFont(0, font)
+            if line.startswith('+') and not line.startswith('+++'):
+                child.setForeground(0, QColor('darkgreen'))
+            elif line.startswith('-') and not line.startswith('---'):
+                child.setForeground(0, QColor('darkred'))
+            item.addChild(child)
+
+class TrackerWorker(QObject):
+    """Runs a TrackerEngine on its own QThread so the window never waits
+    on the filesystem."""
+    ready = pyqtSignal()
+    changes_checked = pyqtSignal(object)  # list of change lines, None if unchanged
+    save_finished = pyqtSignal(bool, bool)  # saved, autosave
+    restore_finished = pyqtSignal(int, int, int)  # written, removed, failed
+    progress = pyqtSignal(int, int)
+    collected = pyqtSignal(int, int)  # saves dropped, bytes reclaimed
+    compared = pyqtSignal(object)  # SaveDiff
+    saves_paged = pyqtSignal(int, object, int)  # offset, catalogue entries, saves in total
+    saves_counted = pyqtSignal(int)
+    text_diffed = pyqtSignal(object, object, object)  # SaveDiff, FileChange, lines
+    archived = pyqtSignal(str)  # export or import summary
+    failed = pyqtSignal(str)
+
+    def __init__(self, cwd):
+        super().__init__()
+        self.engine = TrackerEngine(cwd)
+        self.engine.progress_callback = self.progress.emit
+        self.collect_timer = None
+
+    @pyqtSlot()
+    def start(self):
+        # Created here so the timer belongs to the worker thread
+        self.collect_timer = QTimer()
+        self.collect_timer.setInterval(50)
+        self.collect_timer.timeout.connect(self.collect_step)
+        try:
+            self.engine.open()
+        except Exception as e:
+            self.failed.emit(f"Error scanning {self.engine.cwd}: {e}")
+        self.count_saves()
+        self.ready.emit()
+        self.schedule_collect()
+
+    def shutdown(self):
+        """Called from the GUI thread once the worker thread has stopped"""
+        self.engine.close()
+
+    @pyqtSlot()
+    def check_changes(self):
+        try:
+            self.changes_checked.emit(self.engine.collect_changes())
+        except Exception as e:
+            self.failed.emit(f"Error checking changes: {e}")
+            self.changes_checked.emit(None)
+            return
+        try:
+            saved = self.engine.autosave_if_due()
+        except Exception as e:
+            self.failed.emit(f"Error saving state: {e}")
+            return
+        if saved:
+            self.count_saves()
+            self.save_finished.emit(True, True)
+            self.schedule_collect()
+
+    @pyqtSlot(str, bool)
+    def save(self, comment, only_if_changed):
+        try:
+            saved = self.engine.save_state(comment, only_if_changed)
+        except Exception as e:
+            self.failed.emit(f"Error saving state: {e}")
+            return
+        if saved:
+            self.count_saves()
+        self.save_finished.emit(saved, only_if_changed)
+        if saved:
+            self.schedule_collect()
+
+    @pyqtSlot(str)
+    def restore(self, save_id):
+        try:
+            self.restore_finished.emit(*self.engine.restore_save(save_id))
+        except Exception as e:
+            self.failed.emit(f"Error restoring {save_id}: {e}")
+
+    @pyqtSlot(str, bool)
+    def compare(self, save_id, worktree):
+        """Changes from save_id to the working tree, or the ones save_id made"""
+        try:
+            if worktree:
+                diff = self.engine.compare(save_id)
+            else:
+                diff = self.engine.compare(self.engine.previous_save(save_id), save_id)
+            self.compared.emit(diff)
+        except Exception as e:
+            self.failed.emit(f"Error comparing saves: {e}")
+
+    @pyqtSlot(int, int)
+    def page_saves(self, offset, limit):
+        try:
+            entries = self.engine.store.page_saves(offset, limit)
+            total = len(self.engine.store.catalog)
+        except Exception as e:
+            self.failed.emit(f"Error listing saves: {e}")
+            entries, total = [], offset
+        self.saves_paged.emit(offset, entries, total)
+
+    def count_saves(self):
+        # The window checks this instead of reading the store itself
+        try:
+            self.saves_counted.emit(len(self.engine.store.list_saves()))
+        except Exception as e:
+            self.failed.emit(f"Error listing saves: {e}")
+
+    @pyqtSlot(object, object)
+    def text_diff(self, diff, change):
+        try:
+            lines = diff.text_diff(change)
+        except Exception as e:
+            lines = [f"Error diffing {change.path}: {e}"]
+        self.text_diffed.emit(diff, change, lines)
+
+    @pyqtSlot(str, str)
+    def export_save(self, save_id, path):
+        try:
+            with open(path, 'wb') as f:
+                writer = self.engine.export_saves(f, save_id, compression=compression_for(path))
+        except Exception as e:
+            self.failed.emit(f"Error exporting {save_id}: {e}")
+            return
+        self.archived.emit(f"Exported {save_id}: {writer.objects} objects, {format_size(writer.bytes)}")
+
+    @pyqtSlot(str)
+    def import_saves(self, path):
+        try:
+            with open(path, 'rb') as f:
+                reader = self.engine.import_saves(f)
+        except Exception as e:
+            self.failed.emit(f"Error importing {path}: {e}")
+            return
+        self.count_saves()
+        self.archived.emit(f"Imported {len(reader.saves)} saves: {reader.objects} objects added, "
+                           f"{reader.skipped} already present")
+
+    @pyqtSlot(object)
+    def set_autosave(self, policy):
+        self.engine.set_autosave(policy)
+
+    @pyqtSlot(object)
+    def set_retention(self, policy):
+        self.engine.set_retention(policy)
+        self.schedule_collect(force=True)
+
+    def schedule_collect(self, force=False):
+        # Before start() there is no timer yet, start() schedules the first pass
+        if self.collect_timer is not None and self.engine.schedule_collect(force):
+            self.collect_timer.start()
+
+    def collect_step(self):
+        try:
+            if self.engine.collect_step():
+                return
+        except Exception as e:
+            self.failed.emit(f"Error collecting old saves: {e}")
+        self.collect_timer.stop()
+        collector = self.engine.collector
+        self.count_saves()
+        self.collected.emit(len(collector.dropped), collector.reclaimed)
+        if collector.needs_another_pass():
+            self.schedule_collect(force=True)
 
 class SimpleTracker(QMainWindow):
+    request_scan = pyqtSignal()
+    request_save = pyqtSignal(str, bool)
+    request_restore = pyqtSignal(str)
+    request_retention = pyqtSignal(object)
+    request_autosave = pyqtSignal(object)
+    request_export = pyqtSignal(str, str)
+    request_import = pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("SFTM")
         self.setGeometry(100, 100, 600, 400)
-        
+
         self.cwd = os.getcwd()
         self.saves_dir = os.path.join(self.cwd, '.saves')
-        
-        self.ignore_dirs = {'.tracker_status','.saves', '.git', '__pycache__', '.venv', 'venv', 'env', 'node_modules', '.pytest_cache'}
-        self.ignore_extensions = {'.pyc', '.pyo', '.pyd', '.so', '.git'}
-        
-        # Add autosave settings
-        self.autosave_enabled = False
-        self.autosave_interval = 15  # Default 15 minutes
-        self.autosave_timer = QTimer()
-        self.autosave_timer.timeout.connect(self.auto_save)
-        
-        if not os.path.exists(self.saves_dir):
-            os.makedirs(self.saves_dir)
-            self.save_state("Initial state")
+
+        # Scans and saves run on the worker thread, requests are queued to it
+        # and results come back as signals
+        self.worker = TrackerWorker(self.cwd)
+        # Kept up to date by the worker, which alone reads the store
+        self.save_count = 0
+        self.worker_thread = QThread()
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.worker.start)
+        self.request_scan.connect(self.worker.check_changes)
+        self.request_save.connect(self.worker.save)
+        self.request_restore.connect(self.worker.restore)
+        self.request_retention.connect(self.worker.set_retention)
+        self.request_autosave.connect(self.worker.set_autosave)
+        self.request_export.connect(self.worker.export_save)
+        self.request_import.connect(self.worker.import_saves)
+        self.worker.ready.connect(self.on_worker_ready)
+        self.worker.changes_checked.connect(self.show_changes)
+        self.worker.save_finished.connect(self.on_save_finished)
+        self.worker.restore_finished.connect(self.on_restore_finished)
+        self.worker.progress.connect(self.show_progress)
+        self.worker.collected.connect(self.show_collected)
+        self.worker.saves_counted.connect(self.on_saves_counted)
+        self.worker.archived.connect(self.show_archived)
+        self.worker.failed.connect(self.show_error)
+        # Set while a scan is queued or running, ticks arriving meanwhile are dropped
+        self.scan_in_flight = True
 
         self.init_ui()
-        self.last_state = self.get_files()
-        
+        self.worker_thread.start()
+
         self.timer = QTimer()
         self.timer.timeout.connect(self.check_changes)
         self.timer.start(2000)
         # Create status file indicating running
-        self.status_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
+        self.status_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                        '.tracker_status')
         self.create_status_file()
 
@@ -60,54 +406,128 @@ class SimpleTracker(QMainWindow):
         except Exception as e:
             print(f"Error removing status file: {e}")
 
-            
+
     def closeEvent(self, event):
+        self.shutdown_worker()
         self.cleanup_status_file()
         super().closeEvent(event)
 
+    def shutdown_worker(self):
+        if self.worker_thread.isRunning():
+            self.timer.stop()
+            # Lets a save in progress finish before the thread stops
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+            self.worker.shutdown()
+
     def init_ui(self):
         widget = QWidget()
         self.setCentralWidget(widget)
         layout = QVBoxLayout()
-        
+
         # Status label
-        self.status = QLabel(f"Monitoring changes in {self.cwd}...")
+        self.status = QLabel(f"Scanning {self.cwd}...")
         self.status.setWordWrap(True)
-        
+
+        # Progress of long saves, hidden while idle
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("Saving %v/%m files")
+        self.progress_bar.hide()
+
         # Buttons
         save_btn = QPushButton("Save Current State")
         restore_btn = QPushButton("Restore Previous State")
+        compare_btn = QPushButton("Compare Saves")
+        export_btn = QPushButton("Export Save")
+        import_btn = QPushButton("Import Saves")
         structure_btn = QPushButton("View Project Structure")
 
-        # Autosave group
+        # Autosave group: saves once edits pause, or after the maximum delay
+        autosave = self.worker.engine.autosave
         autosave_group = QGroupBox("Autosave Settings")
         autosave_layout = QHBoxLayout()
-        
+
         self.autosave_checkbox = QCheckBox("Enable Autosave")
-        self.autosave_checkbox.setChecked(self.autosave_enabled)
-        self.autosave_checkbox.stateChanged.connect(self.toggle_autosave)
-        
-        interval_label = QLabel("Interval (minutes):")
-        self.interval_spinbox = QSpinBox()
-        self.interval_spinbox.setRange(1, 60)
-        self.interval_spinbox.setValue(self.autosave_interval)
-        self.interval_spinbox.valueChanged.connect(self.update_autosave_interval)
-        
+        self.autosave_checkbox.setChecked(autosave.enabled)
+
+        quiet_label = QLabel("Quiet (seconds):")
+        self.quiet_spinbox = QSpinBox()
+        self.quiet_spinbox.setRange(2, 600)
+        self.quiet_spinbox.setValue(autosave.quiet)
+
+        delay_label = QLabel("Max delay (minutes):")
+        self.delay_spinbox = QSpinBox()
+        self.delay_spinbox.setRange(1, 60)
+        self.delay_spinbox.setValue(autosave.max_delay // 60)
+
+        self.autosave_checkbox.stateChanged.connect(self.update_autosave)
+        self.quiet_spinbox.valueChanged.connect(self.update_autosave)
+        self.delay_spinbox.valueChanged.connect(self.update_autosave)
+
         autosave_layout.addWidget(self.autosave_checkbox)
-        autosave_layout.addWidget(interval_label)
-        autosave_layout.addWidget(self.interval_spinbox)
+        autosave_layout.addWidget(quiet_label)
+        autosave_layout.addWidget(self.quiet_spinbox)
+        autosave_layout.addWidget(delay_label)
+        autosave_layout.addWidget(self.delay_spinbox)
         autosave_group.setLayout(autosave_layout)
-        
+
+        # Retention group
+        retention = self.worker.engine.retention
+        retention_group = QGroupBox("Retention")
+        retention_layout = QGridLayout()
+
+        self.retention_checkbox = QCheckBox("Prune old saves")
+        self.retention_checkbox.setChecked(retention.enabled)
+        self.keep_all_spinbox = QSpinBox()
+        self.keep_all_spinbox.setRange(1, 48)
+        self.keep_all_spinbox.setValue(retention.keep_all // 3600)
+        self.hourly_spinbox = QSpinBox()
+        self.hourly_spinbox.setRange(1, 30)
+        self.hourly_spinbox.setValue(retention.hourly // 86400)
+        self.daily_spinbox = QSpinBox()
+        self.daily_spinbox.setRange(1, 365)
+        self.daily_spinbox.setValue(retention.daily // 86400)
+        self.budget_spinbox = QSpinBox()
+        self.budget_spinbox.setRange(0, 10 * 1024 * 1024)
+        self.budget_spinbox.setSpecialValueText("None")
+        self.budget_spinbox.setValue((retention.max_bytes or 0) // (1024 * 1024))
+
+        retention_layout.addWidget(self.retention_checkbox, 0, 0)
+        retention_layout.addWidget(QLabel("Keep all (hours):"), 0, 1)
+        retention_layout.addWidget(self.keep_all_spinbox, 0, 2)
+        retention_layout.addWidget(QLabel("Budget (MB):"), 0, 3)
+        retention_layout.addWidget(self.budget_spinbox, 0, 4)
+        retention_layout.addWidget(QLabel("Hourly (days):"), 1, 1)
+        retention_layout.addWidget(self.hourly_spinbox, 1, 2)
+        retention_layout.addWidget(QLabel("Daily (days):"), 1, 3)
+        retention_layout.addWidget(self.daily_spinbox, 1, 4)
+        retention_group.setLayout(retention_layout)
+
+        self.retention_checkbox.stateChanged.connect(self.update_retention)
+        for spinbox in (self.keep_all_spinbox, self.hourly_spinbox,
+                        self.daily_spinbox, self.budget_spinbox):
+            spinbox.valueChanged.connect(self.update_retention)
+
         # Connect buttons
         save_btn.clicked.connect(self.prompt_save)
         restore_btn.clicked.connect(self.prompt_restore)
+        compare_btn.clicked.connect(self.open_diff_viewer)
+        export_btn.clicked.connect(self.prompt_export)
+        import_btn.clicked.connect(self.prompt_import)
         structure_btn.clicked.connect(self.open_structure_viewer)
 
         # Add widgets to layout
         layout.addWidget(self.status)
+        layout.addWidget(self.progress_bar)
         layout.addWidget(autosave_group)
+        layout.addWidget(retention_group)
         layout.addWidget(save_btn)
         layout.addWidget(restore_btn)
+        layout.addWidget(compare_btn)
+        archive_layout = QHBoxLayout()
+        archive_layout.addWidget(export_btn)
+        archive_layout.addWidget(import_btn)
+        layout.addLayout(archive_layout)
         layout.addWidget(structure_btn)
 
         widget.setLayout(layout)
@@ -117,158 +537,143 @@ class SimpleTracker(QMainWindow):
             # Assuming your structure viewer script is named 'project_structure.py'
             # and is in the same directory as this script
             script_path = Path(__file__).parent / 'helpers/struc.py'
-            
+
             if sys.platform.startswith('win'):
                 Popen(['python', str(script_path)], shell=True)
             else:
                 Popen(['python3', str(script_path)])
-                
+
             self.status.setText("Opening project structure viewer...")
         except Exception as e:
             self.status.setText(f"Error opening structure viewer: {str(e)}")
 
+    def update_autosave(self):
+        self.request_autosave.emit(AutosavePolicy(
+            enabled=self.autosave_checkbox.isChecked(),
+            quiet=self.quiet_spinbox.value(),
+            max_delay=self.delay_spinbox.value() * 60))
 
-    def should_ignore(self, path):
-        path_parts = path.split(os.sep)
-        return any(part in self.ignore_dirs for part in path_parts) or \
-               any(path.endswith(ext) for ext in self.ignore_extensions)
-
-    def get_files(self):
-        files = {}
-        for root, _, filenames in os.walk(self.cwd):
-            if self.should_ignore(root):
-                continue
-            for name in filenames:
-                if self.should_ignore(name):
-                    continue
-                path = os.path.join(root, name)
-                try:
-                    with open(path, 'rb') as f:
-                        files[os.path.relpath(path, self.cwd)] = hashlib.md5(f.read()).hexdigest()
-                except:
-                    continue
-        return files
-
-    def save_state(self, comment):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        save_path = os.path.join(self.saves_dir, timestamp)
-        os.makedirs(save_path)
-
-        current_files = self.get_files()
-        for file in current_files:
-            src = os.path.join(self.cwd, file)
-            dst = os.path.join(save_path, file)
-            os.makedirs(os.path.dirname(dst), exist_ok=True)
-            shutil.copy2(src, dst)
-
-        with open(os.path.join(save_path, 'meta.json'), 'w') as f:
-            json.dump({
-                'comment': comment,
-                'timestamp': timestamp,
-                'files': current_files
-            }, f)
-        
-        self.last_state = current_files
-
-    def toggle_autosave(self, state):
-        self.autosave_enabled = bool(state)
-        if self.autosave_enabled:
-            self.start_autosave_timer()
-        else:
-            self.autosave_timer.stop()
-
-    def update_autosave_interval(self, value):
-        self.autosave_interval = value
-        if self.autosave_enabled:
-            self.start_autosave_timer()
-
-    def start_autosave_timer(self):
-        # Convert minutes to milliseconds
-        interval_ms = self.autosave_interval * 60 * 1000
-        self.autosave_timer.start(interval_ms)
-
-    def auto_save(self):
-        if self.autosave_enabled:
-            current_files = self.get_files()
-            if current_files != self.last_state:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                self.save_state(f"Autosave at {timestamp}")
-                self.status.setText("Autosave completed")
+    def update_retention(self):
+        budget = self.budget_spinbox.value()
+        self.request_retention.emit(RetentionPolicy(
+            enabled=self.retention_checkbox.isChecked(),
+            keep_all=self.keep_all_spinbox.value() * 3600,
+            hourly=self.hourly_spinbox.value() * 86400,
+            daily=self.daily_spinbox.value() * 86400,
+            max_bytes=budget * 1024 * 1024 if budget else None))
+
+    def on_saves_counted(self, count):
+        self.save_count = count
+
+    def show_collected(self, dropped, reclaimed):
+        if dropped or reclaimed:
+            self.status.setText(f"Pruned {dropped} saves, freed {format_size(reclaimed)}")
+
+    def show_archived(self, message):
+        self.status.setText(message)
 
     def check_changes(self):
-        current_files = self.get_files()
-        changes = []
-        
-        # Check for new and modified files
-        for file, hash in current_files.items():
-            if file not in self.last_state:
-                changes.append(f"New: {file}")
-            elif hash != self.last_state[file]:
-                changes.append(f"Modified: {file}")
-        
-        # Check for deleted files
-        for file in self.last_state:
-            if file not in current_files:
-                changes.append(f"Deleted: {file}")
+        if self.scan_in_flight:
+            return
+        self.scan_in_flight = True
+        self.request_scan.emit()
+
+    def on_worker_ready(self):
+        self.scan_in_flight = False
+        self.status.setText(f"Monitoring changes in {self.cwd}...")
 
+    def show_changes(self, changes):
+        self.scan_in_flight = False
+        if changes is None:
+            return
         if changes:
             self.status.setText("\n".join(changes[:5] + ['...'] if len(changes) > 5 else changes))
         else:
             self.status.setText(f"{self.cwd} No changes detected")
 
+    def show_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+        self.progress_bar.setVisible(done < total)
+
+    def show_error(self, message):
+        self.progress_bar.hide()
+        self.status.setText(message)
+
+    def on_save_finished(self, saved, autosave):
+        self.progress_bar.hide()
+        if autosave:
+            if saved:
+                self.status.setText("Autosave completed")
+        else:
+            self.status.setText("State saved successfully")
+
+    def on_restore_finished(self, written, removed, failed):
+        message = f"State restored: {written} files written, {removed} removed"
+        if failed:
+            message += f", {failed} failed"
+        self.status.setText(message)
+
     def prompt_save(self):
         comment, ok = QInputDialog.getText(self, 'Save', 'Comment for this save:')
         if ok and comment:
-            self.save_state(comment)
-            self.status.setText("State saved successfully")
+            self.status.setText("Saving...")
+            self.request_save.emit(comment, False)
+
+    def open_diff_viewer(self):
+        if not self.save_count:
+            self.status.setText("No saves found")
+            return
+        DiffViewer(self.worker, self).exec()
 
     def prompt_restore(self):
-        saves = []
-        for save in sorted(os.listdir(self.saves_dir)):
-            try:
-                with open(os.path.join(self.saves_dir, save, 'meta.json')) as f:
-                    meta = json.load(f)
-                    saves.append(f"{meta['timestamp']} - {meta['comment']}")
-            except:
-                continue
-
-        if not saves:
+        if not self.save_count:
             self.status.setText("No saves found")
             return
 
-        save, ok = QInputDialog.getItem(self, 'Restore', 'Select save:', saves, 0, False)
-        if ok and save:
-            timestamp = save.split(' - ')[0]
-            save_path = os.path.join(self.saves_dir, timestamp)
-            
-            # Load the saved state
-            with open(os.path.join(save_path, 'meta.json')) as f:
-                saved_state = json.load(f)
-            
-            # Restore files
-            for file in saved_state['files']:
-                src = os.path.join(save_path, file)
-                dst = os.path.join(self.cwd, file)
-                if os.path.exists(src):
-                    os.makedirs(os.path.dirname(dst), exist_ok=True)
-                    shutil.copy2(src, dst)
-            
-            self.last_state = saved_state['files']
-            self.status.setText("State restored successfully")
+        picker = SavePicker(self.worker, self)
+        timestamp = picker.selected_save() if picker.exec() else None
+        picker.deleteLater()
+        if timestamp:
+            self.status.setText(f"Restoring {timestamp}...")
+            self.request_restore.emit(timestamp)
+
+    def prompt_export(self):
+        if not self.save_count:
+            self.status.setText("No saves found")
+            return
+        picker = SavePicker(self.worker, self, title='Export')
+        save_id = picker.selected_save() if picker.exec() else None
+        picker.deleteLater()
+        if not save_id:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, 'Export Save', f"{save_id}.tar.gz",
+                                              'Archives (*.tar *.tar.gz *.tgz *.tar.xz)')
+        if path:
+            self.status.setText(f"Exporting {save_id}...")
+            self.request_export.emit(save_id, path)
+
+    def prompt_import(self):
+        path, _ = QFileDialog.getOpenFileName(self, 'Import Saves', '',
+                                              'Archives (*.tar *.tar.gz *.tgz *.tar.xz *.tar.bz2)')
+        if path:
+            self.status.setText(f"Importing {path}...")
+            self.request_import.emit(path)
 
 if __name__ == '__main__':
     import signal
-    
+
     app = QApplication([])
     window = SimpleTracker()
-    
+    app.aboutToQuit.connect(window.shutdown_worker)
+
     # Handle system signals
     def signal_handler(signum, frame):
         window.cleanup_status_file()
         app.quit()
-    
+
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
-    
+
     window.show()
-    app.exec()
\ No newline at end of file
+    app.exec()
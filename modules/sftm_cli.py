@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Headless Simple File Tracker.
+
+    sftm_cli.py watch [--quiet SEC] [--max-delay MIN] [--poll SEC] [--prune] [--budget MB] [--stats]
+    sftm_cli.py save -m MESSAGE
+    sftm_cli.py list [-n COUNT]
+    sftm_cli.py restore SAVE_ID
+    sftm_cli.py diff [-p] [SAVE_ID [SAVE_ID]]
+    sftm_cli.py export [-o FILE] [-z gz|bz2|xz] [--base SAVE_ID] SAVE_ID [SAVE_ID]
+    sftm_cli.py import FILE
+
+Works on the current directory (or --dir) and shares .saves with the GUI,
+commands that write to it wait for .saves/lock.
+Does not import PyQt6, so it runs over ssh and in containers."""
+import argparse
+import os
+import sys
+import time
+from helpers.tracker_engine import TrackerEngine, describe_save, format_size
+from helpers.retention import RetentionPolicy
+from helpers.autosave import AutosavePolicy
+from helpers.save_archive import compression_for
+
+def watch(engine, args):
+    engine.open()
+    if args.prune or args.budget is not None:
+        max_bytes = int(args.budget * 1024 * 1024) if args.budget is not None else None
+        engine.set_retention(RetentionPolicy(enabled=True, max_bytes=max_bytes))
+    engine.set_autosave(AutosavePolicy(enabled=args.max_delay > 0, quiet=args.quiet,
+                                       max_delay=args.max_delay * 60))
+    print(f"Watching {engine.cwd}, last save {engine.last_save_id}")
+    last_changes = []
+    passes = engine.scan_cache.passes
+    engine.schedule_collect()
+    try:
+        while True:
+            changes = engine.collect_changes()
+            if args.stats and engine.scan_cache.passes != passes:
+                passes = engine.scan_cache.passes
+                report_scan(engine.scan_cache.stats())
+            if changes is not None and changes != last_changes:
+                last_changes = changes
+                print(f"{len(changes)} changes" if changes else "No changes")
+                for line in changes:
+                    print(f"  {line}")
+
+            if engine.autosave_if_due():
+                print(f"Autosaved {engine.last_save_id}")
+                last_changes = []
+                engine.schedule_collect()
+
+            # Collection runs in the idle time until the next poll
+            deadline = time.monotonic() + args.poll
+            while engine.collector.active and time.monotonic() < deadline:
+                try:
+                    if not engine.collect_step():
+                        report_collected(engine)
+                except Exception as e:
+                    print(f"Error collecting old saves: {e}", file=sys.stderr)
+            time.sleep(max(0, deadline - time.monotonic()))
+    except KeyboardInterrupt:
+        pass
+
+def report_scan(stats):
+    full = " (paranoid full rehash)" if stats['full_pass'] else ""
+    print(f"Scanned: {stats['stat_skipped']} unchanged by stat, {stats['rehashed']} hashed{full}")
+
+def report_collected(engine):
+    collector = engine.collector
+    if collector.dropped or collector.reclaimed:
+        print(f"Pruned {len(collector.dropped)} saves, freed {format_size(collector.reclaimed)}")
+    if collector.needs_another_pass():
+        engine.schedule_collect(force=True)
+
+def save(engine, args):
+    engine.open(watch=False)
+    engine.save_state(args.message)
+    print(engine.last_save_id)
+
+def list_saves(engine, args):
+    for entry in engine.store.page_saves(0, args.count):
+        print(describe_save(entry))
+
+def restore(engine, args):
+    engine.open(watch=False)
+    if args.save_id not in engine.store.list_saves():
+        print(f"No save {args.save_id}", file=sys.stderr)
+        return 1
+    written, removed, failed = engine.restore_save(args.save_id)
+    print(f"Restored {args.save_id}: {written} files written, {removed} removed")
+    if failed:
+        print(f"{failed} files could not be restored", file=sys.stderr)
+        return 1
+
+def diff(engine, args):
+    engine.open(watch=False)
+    old_id = args.old or engine.last_save_id
+    saves = engine.store.list_saves()
+    for save_id in (old_id, args.new):
+        if save_id is not None and save_id not in saves:
+            print(f"No save {save_id}", file=sys.stderr)
+            return 1
+    result = engine.compare(old_id, args.new)
+    for change in result.changes:
+        print(change)
+        if args.patch:
+            for line in result.text_diff(change):
+                print(line)
+
+def export(engine, args):
+    compression = args.compress if args.compress is not None else compression_for(args.output)
+    if args.output == '-':
+        writer = engine.export_saves(sys.stdout.buffer, args.first, args.last, args.base, compression)
+    else:
+        with open(args.output, 'wb') as f:
+            writer = engine.export_saves(f, args.first, args.last, args.base, compression)
+    # stdout may be the archive itself
+    print(f"Exported {writer.objects} objects, {format_size(writer.bytes)}", file=sys.stderr)
+    if writer.missing:
+        print(f"{writer.missing} objects were missing from the store", file=sys.stderr)
+
+def import_archive(engine, args):
+    if args.file == '-':
+        reader = engine.import_saves(sys.stdin.buffer)
+    else:
+        with open(args.file, 'rb') as f:
+            reader = engine.import_saves(f)
+    for save_id in reader.saves:
+        print(f"Imported {save_id}")
+    print(f"{reader.objects} objects added ({format_size(reader.bytes)}), "
+          f"{reader.skipped} already present")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='sftm', description="Simple File Tracker")
+    parser.add_argument('--dir', default=os.getcwd(), help="directory to track")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('watch', help="report changes and autosave until interrupted")
+    p.add_argument('--quiet', type=float, default=30, help="autosave after this many seconds without edits")
+    p.add_argument('--max-delay', type=float, default=15,
+                   help="autosave at most this many minutes after an edit, 0 disables autosave")
+    p.add_argument('--poll', type=float, default=2, help="seconds between change checks")
+    p.add_argument('--prune', action='store_true', help="apply the default retention policy")
+    p.add_argument('--budget', type=float, help="prune oldest saves above this many MB")
+    p.add_argument('--stats', action='store_true',
+                   help="print how many files each scan skipped by stat data and hashed")
+    p.set_defaults(run=watch)
+
+    p = commands.add_parser('save', help="save the current state")
+    p.add_argument('-m', '--message', default="Manual save")
+    p.set_defaults(run=save)
+
+    p = commands.add_parser('list', help="list saves, newest first")
+    p.add_argument('-n', '--count', type=int, default=20)
+    p.set_defaults(run=list_saves)
+
+    p = commands.add_parser('restore', help="restore the working tree to a save")
+    p.add_argument('save_id')
+    p.set_defaults(run=restore)
+
+    p = commands.add_parser('diff', help="changes from a save, by default the last one, "
+                                         "to another save or the working tree")
+    p.add_argument('old', nargs='?')
+    p.add_argument('new', nargs='?')
+    p.add_argument('-p', '--patch', action='store_true', help="show line diffs")
+    p.set_defaults(run=diff)
+
+    p = commands.add_parser('export', help="write saves and their objects to one tar")
+    p.add_argument('first', help="oldest save to export")
+    p.add_argument('last', nargs='?', help="newest save to export, by default only the first")
+    p.add_argument('-o', '--output', default='-', help="archive file, - for stdout")
+    p.add_argument('-z', '--compress', choices=['', 'gz', 'bz2', 'xz'],
+                   help="compression, by default from the file name")
+    p.add_argument('--base', help="save the destination already has, its objects are left out")
+    p.set_defaults(run=export)
+
+    p = commands.add_parser('import', help="add the saves of an archive, - reads stdin")
+    p.add_argument('file')
+    p.set_defaults(run=import_archive)
+
+    args = parser.parse_args(argv)
+    engine = TrackerEngine(os.path.abspath(args.dir))
+    try:
+        return args.run(engine, args) or 0
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        engine.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
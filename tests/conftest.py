@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules import each other as helpers.x, like when run from modules/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modules'))
@@ -0,0 +1,192 @@
+import io
+import os
+import random
+
+import pytest
+
+from helpers.tracker_engine import TrackerEngine
+from helpers.hashing import FileHasher
+from helpers.save_pipeline import SavePipeline
+from helpers.retention import RetentionPolicy
+from helpers.chunking import MIN_CHUNK
+
+
+def make_engine(root, max_hash_size=None, chunk_threshold=None):
+    """An engine on root without the watcher, optionally with a small hash
+    cap (large files go by stat data) or chunk threshold"""
+    engine = TrackerEngine(str(root))
+    engine.use_inotify = False
+    engine.restore_extras = 'delete'
+    if max_hash_size is not None:
+        engine.max_hash_size = max_hash_size
+    if chunk_threshold is not None:
+        engine.chunk_threshold = chunk_threshold
+    engine.hasher = FileHasher(engine.hash_algorithm, engine.max_hash_size)
+    engine.pipeline = SavePipeline(engine.store, engine.hash_algorithm, engine.max_hash_size,
+                                   engine.hardlink_saves, engine.chunk_threshold)
+    engine.open(watch=False)
+    return engine
+
+
+@pytest.fixture
+def engines():
+    opened = []
+
+    def open_engine(root, **settings):
+        engine = make_engine(root, **settings)
+        opened.append(engine)
+        return engine
+
+    yield open_engine
+    for engine in opened:
+        engine.close()
+
+
+def write(root, rel_path, data):
+    path = os.path.join(root, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def snapshot(root):
+    """Contents of every file under root outside .saves"""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != '.saves']
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+def test_same_size_same_mtime_large_files(tmp_path, engines):
+    # Above the hash cap both files are tracked by size and mtime only
+    a = write(tmp_path, 'a.bin', b'a' * 300_000)
+    b = write(tmp_path, 'b.bin', b'b' * 300_000)
+    mtime_ns = os.stat(a).st_mtime_ns - 10_000_000_000
+    os.utime(a, ns=(mtime_ns, mtime_ns))
+    os.utime(b, ns=(mtime_ns, mtime_ns))
+    engine = engines(tmp_path, max_hash_size=1000)
+    engine.save_state("Both")
+    save_id = engine.last_save_id
+    files = engine.store.load_files(save_id)
+    assert files['a.bin'] != files['b.bin']
+
+    os.remove(a)
+    write(tmp_path, 'b.bin', b'x')
+    engine.restore_save(save_id)
+    assert snapshot(tmp_path) == {'a.bin': b'a' * 300_000, 'b.bin': b'b' * 300_000}
+
+
+def test_chunked_file_round_trip(tmp_path, engines):
+    rng = random.Random(1)
+    data = rng.randbytes(4 * 1024 * 1024)
+    write(tmp_path, 'big.bin', data)
+    engine = engines(tmp_path, chunk_threshold=MIN_CHUNK * 2)
+    first = engine.last_save_id
+    assert engine.store.load_files(first)['big.bin'] in engine.store.chunks
+
+    # A local edit only adds the chunks around it
+    edited = data[:1_000_000] + b'edit' + data[1_000_004:]
+    write(tmp_path, 'big.bin', edited)
+    engine.save_state("Edited")
+    assert 0 < engine.pipeline.new_chunk_bytes < len(data) // 2
+
+    engine.restore_save(first)
+    assert snapshot(tmp_path)['big.bin'] == data
+    engine.restore_save(engine.store.list_saves()[-1])
+    assert snapshot(tmp_path)['big.bin'] == edited
+
+
+def test_delta_chain_replay(tmp_path, engines):
+    write(tmp_path, 'keep.txt', b'unchanged')
+    engine = engines(tmp_path)
+    expected = {}
+    # Past a checkpoint, so both full and delta manifests are replayed
+    for n in range(engine.store.checkpoint_interval + 5):
+        write(tmp_path, f'dir/file{n % 7}.txt', f'version {n}\n'.encode())
+        if n % 5 == 4:
+            os.remove(os.path.join(tmp_path, f'dir/file{(n + 3) % 7}.txt'))
+        engine.save_state(f"Save {n}")
+        expected[engine.last_save_id] = snapshot(tmp_path)
+    assert len(expected) == engine.store.checkpoint_interval + 5
+
+    reopened = engines(tmp_path)
+    for save_id, files in expected.items():
+        written, removed, failed = reopened.restore_save(save_id)
+        assert failed == 0
+        assert snapshot(tmp_path) == files
+
+
+def test_collect_drops_saves_and_their_objects(tmp_path, engines):
+    engine = engines(tmp_path)
+    rng = random.Random(2)
+    expected = {}
+    for n in range(6):
+        # Above the pack limit, so each version is a loose object
+        write(tmp_path, 'data.bin', rng.randbytes(200_000))
+        write(tmp_path, f'note{n}.txt', f'note {n}'.encode())
+        engine.save_state(f"Autosave {n}")
+        expected[engine.last_save_id] = snapshot(tmp_path)
+    saves = engine.store.list_saves()
+    old_digest = engine.store.load_files(saves[1])['data.bin']
+    assert os.path.exists(engine.store.object_path(old_digest))
+
+    # The budget is applied from the size the first pass measures
+    engine.set_retention(RetentionPolicy(enabled=True, max_bytes=1, keep_manual=False))
+    for _ in range(2):
+        assert engine.schedule_collect(force=True)
+        while engine.collect_step():
+            pass
+    assert engine.collector.dropped
+    assert engine.collector.reclaimed > 0
+
+    kept = engine.store.list_saves()
+    assert engine.last_save_id in kept
+    assert len(kept) < len(saves)
+    assert not os.path.exists(engine.store.object_path(old_digest))
+    for save_id in kept:
+        assert engine.restore_save(save_id)[2] == 0
+        assert snapshot(tmp_path) == expected[save_id]
+
+
+def test_export_import_round_trip(tmp_path, engines):
+    source = tmp_path / 'source'
+    source.mkdir()
+    write(source, 'small.txt', b'small')
+    write(source, 'large.bin', random.Random(3).randbytes(300_000))
+    engine = engines(source)
+    write(source, 'small.txt', b'changed')
+    engine.save_state("Second")
+    saves = engine.store.list_saves()
+    expected = snapshot(source)
+
+    archive = io.BytesIO()
+    engine.export_saves(archive, saves[0], saves[-1], compression='gz')
+    archive.seek(0)
+
+    target = tmp_path / 'target'
+    target.mkdir()
+    other = engines(target)
+    reader = other.import_saves(archive)
+    # Ids the target already uses are imported under a suffix
+    assert len(reader.saves) == len(saves)
+    assert other.restore_save(reader.saves[-1])[2] == 0
+    assert snapshot(target) == expected
+
+
+def test_restore_keeps_permission_bits(tmp_path, engines):
+    script = write(tmp_path, 'run.sh', b'#!/bin/sh\n')
+    os.chmod(script, 0o755)
+    engine = engines(tmp_path)
+    engine.save_state("Executable")
+    save_id = engine.last_save_id
+
+    os.chmod(script, 0o644)
+    engine.save_state("Plain")
+    os.remove(script)
+    engine.restore_save(save_id)
+    assert os.stat(script).st_mode & 0o777 == 0o755